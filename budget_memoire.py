@@ -0,0 +1,198 @@
+"""Contrôle de non-régression de l'empreinte mémoire.
+
+Chaque étape (extraction du classeur, rendu du bordereau, chargement du
+carnet d'adresses) est exécutée sur des entrées synthétiques de taille
+croissante. Le pic d'allocation est mesuré avec tracemalloc, la RSS est
+relevée à titre indicatif. Le script échoue (code de sortie 1) si une étape
+dépasse son budget ou si sa consommation croît plus vite que la taille des
+entrées.
+
+Usage : python budget_memoire.py
+"""
+import gc
+import math
+import os
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+import openpyxl
+import contacts
+from generer_pdf import DispatchDocument
+from lecture_excel import InformationExcelCells, filesExcelCells, read_workbook
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MIB = 1024 * 1024
+
+# Exposant maximal toléré entre la taille des entrées et le pic mémoire
+MAX_GROWTH_EXPONENT = 1.2
+
+
+def _rss():
+    """Retourne la RSS courante du processus en octets (None si indisponible)."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def build_workbook(size, directory):
+    """Crée un classeur avec une page de garde et 'size' lignes de fichiers."""
+    info_cells = InformationExcelCells()
+    values = {
+        info_cells.PROJECT: "NANCY-A1-PROJET-12345",
+        info_cells.DATE: datetime(2024, 1, 15),
+        info_cells.SENDER: "Expéditeur",
+        info_cells.ID: "BE-0001",
+        info_cells.SENDING_INFO: "@Jean Dupont (RTE CDI NANCY) #Envoi des plans",
+        info_cells.FILES_QUANTITY: size,
+        info_cells.MESSAGE: "Message",
+    }
+
+    workbook = openpyxl.Workbook(write_only=True)
+    info_sheet = workbook.create_sheet(info_cells.INFO_WORKSHEET)
+    for row_index in range(1, 12):
+        row = [None, None, None]
+        for column_index, column in enumerate("ABC"):
+            row[column_index] = values.get(f"{column}{row_index}")
+        info_sheet.append(row)
+
+    files_sheet = workbook.create_sheet(filesExcelCells().FILES_WORKSHEET)
+    files_sheet.append(["Numéro", "Titre", "Indice", "Format"])
+    for i in range(size):
+        files_sheet.append([f"DOC-{i:06d}", f"Plan de détail n°{i}", "A", "A1"])
+
+    path = os.path.join(directory, f"classeur_{size}.xlsx")
+    workbook.save(path)
+    return path
+
+
+def build_form_data(size, directory):
+    """Prépare un bordereau listant 'size' lignes de fichiers."""
+    form_data = {
+        'rank': "A1",
+        'project': "PROJET",
+        'number': "12345",
+        'date': "2024-01-15",
+        'id': "BE-0001",
+        'title': "Envoi des plans",
+        'sender': "Expéditeur",
+        'receiver': "Jean Dupont",
+        'company': "RTE CDI NANCY",
+        'files_quantity': str(size),
+        'message': "Message",
+        'status': "BPE",
+        'status_text': "Bon pour exécution",
+        'response_delay': "",
+        'transmission_modes': {'mail': True, 'transfer': False, 'courrier': False, 'acc': False},
+        'files_header': ["Numéro", "Titre", "Indice", "Format"],
+        'files': [[f"DOC-{i:06d}", f"Plan de détail n°{i}", "A", "A1"] for i in range(size)]
+    }
+    return form_data, os.path.join(directory, "bordereau.pdf")
+
+
+def build_contacts(size, directory):
+    """Crée un carnet d'adresses de 'size' contacts répartis par entreprises de 10."""
+    data = {"entreprises": []}
+    for c in range(max(size // 10, 1)):
+        data["entreprises"].append({
+            "nom": f"ENTREPRISE {c}",
+            "adresse": {"rue": f"{c} rue de Nancy", "ville": "NANCY", "code_postal": "54000", "pays": "France"},
+            "personnel": [
+                {"prenom": f"Prénom{e}", "nom": f"NOM{c}-{e}", "email": f"contact{c}.{e}@exemple.fr"}
+                for e in range(10)
+            ]
+        })
+    path = os.path.join(directory, f"contacts_{size}.json")
+    contacts.save_data(data, path)
+    return path
+
+
+def run_extraction(path):
+    read_workbook(path)
+
+
+def run_rendering(argument):
+    form_data, output_path = argument
+    DispatchDocument(form_data).generate_pdf(output_path)
+
+
+def run_contacts(path):
+    contacts.ContactStore(path)
+
+
+# Étape : (préparation, exécution, tailles, budget du pic à la plus grande taille)
+STAGES = {
+    "extraction": (build_workbook, run_extraction, (1_000, 4_000, 16_000), 32 * MIB),
+    "rendu": (build_form_data, run_rendering, (250, 1_000, 4_000), 16 * MIB),
+    "contacts": (build_contacts, run_contacts, (1_000, 10_000, 50_000), 96 * MIB),
+}
+
+
+def measure(run, argument):
+    """Exécute une étape et retourne (pic tracemalloc, variation de RSS) en octets."""
+    gc.collect()
+    rss_before = _rss()
+    tracemalloc.start()
+    try:
+        run(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    rss_after = _rss()
+    rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    return peak, rss_delta
+
+
+def check_stage(name, results, budget):
+    """Retourne la liste des dépassements constatés pour une étape."""
+    failures = []
+    largest_size, largest_peak, _ = results[-1]
+    if largest_peak > budget:
+        failures.append(
+            f"{name} : pic de {largest_peak / MIB:.1f} Mio pour {largest_size} "
+            f"(budget {budget / MIB:.1f} Mio)"
+        )
+
+    smallest_size, smallest_peak, _ = results[0]
+    if smallest_peak and largest_size > smallest_size:
+        exponent = math.log(largest_peak / smallest_peak) / math.log(largest_size / smallest_size)
+        if exponent > MAX_GROWTH_EXPONENT:
+            failures.append(
+                f"{name} : croissance super-linéaire (exposant {exponent:.2f} > {MAX_GROWTH_EXPONENT})"
+            )
+    return failures
+
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (build, run, sizes, budget) in STAGES.items():
+            results = []
+            for size in sizes:
+                argument = build(size, directory)
+                peak, rss_delta = measure(run, argument)
+                results.append((size, peak, rss_delta))
+                rss_text = f"{rss_delta / MIB:+.1f} Mio" if rss_delta is not None else "n/d"
+                print(f"{name:<12} taille={size:<8} pic={peak / MIB:8.2f} Mio  RSS={rss_text}")
+            failures.extend(check_stage(name, results, budget))
+
+    if failures:
+        print("\nÉchecs :")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+
+    print("\nToutes les étapes respectent leur budget mémoire.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,547 @@
+import copy
+import csv
 import json
 import os
+import socket
+import tempfile
+import time
 import ttkbootstrap as ttk
 import re
-from tkinter import messagebox
+import unicodedata
+import uuid
+import openpyxl
+from collections import Counter
+from itertools import groupby
+from contextlib import contextmanager
+from tkinter import messagebox, filedialog
 
 FICHIER_JSON = "contacts.json"
+SEARCH_DELAY_MS = 150
+RELOAD_INTERVAL_MS = 2000
+# Un verrou resté identique pendant STALE_LOCK_AGE secondes d'observation est considéré abandonné ;
+# l'attente doit durer plus longtemps pour pouvoir le constater
+STALE_LOCK_AGE = 20
+LOCK_TIMEOUT = 30
+# Espace de noms des identifiants attribués aux fiches enregistrées avant leur introduction
+LEGACY_ID_NAMESPACE = uuid.UUID("6f1c2b4e-8d3a-4c5f-9e7b-2a1d0c3e5f47")
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+# Colonnes des fichiers d'import/export et intitulés acceptés à l'import
+EXCHANGE_COLUMNS = ["entreprise", "rue", "code_postal", "ville", "pays", "nom", "prenom", "email"]
+ADDRESS_FIELDS = ["rue", "code_postal", "ville", "pays"]
+COLUMN_ALIASES = {
+    "societe": "entreprise",
+    "adresse": "rue",
+    "cp": "code_postal",
+    "code postal": "code_postal",
+    "mail": "email",
+    "e-mail": "email",
+    "courriel": "email",
+}
+
+
+def normalize_text(text):
+    """Met un texte en minuscules, sans accents ni espaces superflus, pour la recherche"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.casefold().split())
+
+
+def company_key(name):
+    """Clé de comparaison d'un nom d'entreprise : normalisé et sans ponctuation"""
+    return " ".join(re.sub(r"[\W_]+", " ", normalize_text(name)).split())
+
+
+def new_record_id():
+    """Identifiant stable d'une entreprise ou d'un contact, conservé quand son nom ou son email change"""
+    return uuid.uuid4().hex
+
+
+def ensure_ids(data):
+    """Attribue un identifiant aux fiches qui n'en ont pas encore
+
+    Pour un fichier antérieur aux identifiants, ils sont déduits du contenu et
+    de la position : deux instances qui chargent le même fichier obtiennent
+    les mêmes, ce qui permet de fusionner leurs modifications.
+    """
+    seen = Counter()
+    for company in data.get("entreprises", []):
+        company_name = company_key(company["nom"])
+        if not company.get("id"):
+            company["id"] = uuid.uuid5(LEGACY_ID_NAMESPACE, f"{company_name}/{seen[company_name]}").hex
+        seen[company_name] += 1
+        for employee in company.get("personnel", []):
+            name = f'{company["id"]}/{normalize_text(employee["nom"])}/{normalize_text(employee["prenom"])}'
+            if not employee.get("id"):
+                employee["id"] = uuid.uuid5(LEGACY_ID_NAMESPACE, f"{name}/{seen[name]}").hex
+            seen[name] += 1
+    return data
+
+
+def load_data(path=FICHIER_JSON):
+    try:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return ensure_ids(json.load(f))
+    except FileNotFoundError:
+        return {"entreprises": []}
 
 
-def load_data():
+def save_data(data, path=FICHIER_JSON):
+    """Enregistre les données par remplacement atomique : un lecteur voit l'ancien ou le nouveau fichier"""
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(suffix=".json", dir=directory)
     try:
-        if os.path.exists(FICHIER_JSON):
-            with open(FICHIER_JSON, "r", encoding="utf-8") as f:
-                return json.load(f)
+        with os.fdopen(descriptor, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        for attempt in range(20):
+            try:
+                os.replace(temporary, path)
+                break
+            except PermissionError:
+                # Sous Windows, le remplacement échoue tant qu'un lecteur a le fichier ouvert
+                if attempt == 19:
+                    raise
+                time.sleep(0.05)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def _lock_signature(lock_path):
+    """Contenu et empreinte du fichier de verrou, None s'il n'existe plus"""
+    try:
+        stat = os.stat(lock_path)
+        with open(lock_path, "rb") as f:
+            content = f.read()
     except FileNotFoundError:
-        return {"entreprises": []}
+        return None
+    return content, stat.st_ino, stat.st_size, stat.st_mtime_ns
 
 
-def save_data(data):
-    with open(FICHIER_JSON, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def _break_stale_lock(lock_path, signature):
+    """Supprime un verrou abandonné, même si plusieurs instances le constatent en même temps
+
+    Le verrou est d'abord renommé sous un nom unique : une seule instance y
+    parvient. Si le fichier obtenu n'est plus celui qui a été observé, un autre
+    propriétaire venait de reprendre le verrou : il lui est rendu, sans écraser
+    un verrou plus récent.
+    """
+    claimed = f"{lock_path}.{uuid.uuid4().hex}"
+    try:
+        os.rename(lock_path, claimed)
+    except FileNotFoundError:
+        return
+    try:
+        if _lock_signature(claimed) != signature:
+            try:
+                os.link(claimed, lock_path)
+            except OSError:
+                pass
+    finally:
+        os.remove(claimed)
+
+
+@contextmanager
+def commit_lock(path=FICHIER_JSON, timeout=LOCK_TIMEOUT):
+    """Verrou consultatif posé uniquement le temps d'un enregistrement
+
+    L'abandon d'un verrou se mesure avec l'horloge locale : la date de
+    modification fixée par un serveur de fichiers n'est pas comparable à
+    l'heure d'un poste dont l'horloge dérive.
+    """
+    lock_path = path + ".lock"
+    owner = f"{socket.gethostname()} {os.getpid()} {uuid.uuid4().hex}".encode("utf-8")
+    deadline = time.monotonic() + timeout
+    # Verrou observé et instant local depuis lequel il n'a pas changé
+    observed, observed_since = None, None
+    while True:
+        try:
+            descriptor = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            signature = _lock_signature(lock_path)
+            if signature is None:
+                continue
+            now = time.monotonic()
+            if signature != observed:
+                observed, observed_since = signature, now
+            elif now - observed_since > STALE_LOCK_AGE:
+                # Verrou abandonné par une instance arrêtée brutalement
+                _break_stale_lock(lock_path, signature)
+                observed = None
+                continue
+            if now > deadline:
+                raise TimeoutError(f"Le carnet d'adresses est verrouillé ({lock_path})")
+            time.sleep(0.05)
+
+    try:
+        os.write(descriptor, owner)
+        os.close(descriptor)
+        yield
+    finally:
+        # Ne pas supprimer le verrou d'une autre instance si le nôtre a été jugé abandonné
+        try:
+            with open(lock_path, "rb") as f:
+                held = f.read() == owner
+            if held:
+                os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+
+def _record_key(record):
+    # L'identifiant ne change pas quand le nom ou l'email est modifié
+    return record["id"]
+
+
+def _keyed(records, key):
+    """Indexe des enregistrements par clé ; les clés répétées sont numérotées pour n'en perdre aucun"""
+    seen = Counter()
+    keyed = {}
+    for record in records:
+        k = key(record)
+        keyed[(k, seen[k])] = record
+        seen[k] += 1
+    return keyed
+
+
+def _merge_fields(base, ours, theirs):
+    """Fusion champ par champ ; en cas de conflit, la modification locale l'emporte"""
+    merged = {}
+    for field in list(theirs) + [field for field in ours if field not in theirs]:
+        our_value, base_value = ours.get(field), base.get(field)
+        if our_value == base_value:
+            if field in theirs:
+                merged[field] = theirs[field]
+        elif field in ours:
+            merged[field] = our_value
+    return merged
+
+
+def _merge_records(base, ours, theirs, key, merge_record):
+    """Fusion à trois voies de deux listes d'enregistrements, enregistrement par enregistrement"""
+    base_keyed, our_keyed, their_keyed = _keyed(base, key), _keyed(ours, key), _keyed(theirs, key)
+
+    merged = []
+    for k in list(their_keyed) + [k for k in our_keyed if k not in their_keyed]:
+        b, o, t = base_keyed.get(k), our_keyed.get(k), their_keyed.get(k)
+        if o == b:
+            record = t
+        elif t == b:
+            record = o
+        elif o is None or t is None:
+            # Suppression d'un côté, modification de l'autre : on garde la version modifiée
+            record = o if o is not None else t
+        else:
+            record = merge_record(b or {}, o, t)
+        if record is not None:
+            merged.append(record)
+    return merged
+
+
+def _merge_company(base, ours, theirs):
+    merged = _merge_fields(base, ours, theirs)
+    merged["adresse"] = _merge_fields(base.get("adresse", {}), ours.get("adresse", {}), theirs.get("adresse", {}))
+    merged["personnel"] = _merge_records(
+        base.get("personnel", []), ours.get("personnel", []), theirs.get("personnel", []),
+        _record_key, _merge_fields
+    )
+    return merged
+
+
+def merge_data(base, ours, theirs):
+    """Fusionne les modifications locales (ours) et celles d'une autre instance (theirs) depuis base"""
+    for version in (base, ours, theirs):
+        ensure_ids(version)
+    merged = dict(theirs)
+    merged["entreprises"] = _merge_records(
+        base.get("entreprises", []), ours.get("entreprises", []), theirs.get("entreprises", []),
+        _record_key, _merge_company
+    )
+    return merged
+
+
+class ContactStore:
+    """Carnet d'adresses partagé entre plusieurs instances de l'application
+
+    Les lectures se font sans verrou. Chaque enregistrement incrémente le
+    numéro de version du fichier ; un changement est détecté par os.stat puis
+    confirmé par ce numéro, et n'entraîne qu'alors un rechargement.
+    """
+
+    def __init__(self, path=FICHIER_JSON):
+        self.path = path
+        self.data = {"entreprises": []}
+        self._base_text = None
+        self._stamp = None
+        self._read()
+
+    @property
+    def version(self):
+        return self.data.get("version", 0)
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load_disk(self):
+        """Retourne (texte, données, empreinte) du fichier tel qu'il est sur le disque"""
+        stamp = self._file_stamp()
+        if stamp is None:
+            return None, {"entreprises": []}, None
+        with open(self.path, "r", encoding="utf-8") as f:
+            text = f.read()
+        return text, ensure_ids(json.loads(text)), stamp
+
+    def _read(self):
+        self._base_text, self.data, self._stamp = self._load_disk()
+
+    def _base(self):
+        return ensure_ids(json.loads(self._base_text)) if self._base_text else {"entreprises": []}
+
+    def has_changed(self):
+        """Indique, sans lire le fichier, si une autre instance a pu l'enregistrer"""
+        return self._file_stamp() != self._stamp
+
+    def reload_if_changed(self):
+        """Recharge le fichier si une autre instance l'a modifié ; retourne True dans ce cas"""
+        if not self.has_changed():
+            return False
+
+        text, theirs, stamp = self._load_disk()
+        base = self._base()
+        if theirs.get("version", 0) == base.get("version", 0) and text == self._base_text:
+            self._stamp = stamp
+            return False
+
+        self.data = merge_data(base, self.data, theirs)
+        self._base_text, self._stamp = text, stamp
+        return True
+
+    def commit(self):
+        """Enregistre les modifications locales fusionnées avec celles des autres instances"""
+        with commit_lock(self.path):
+            _, theirs, _ = self._load_disk()
+            merged = merge_data(self._base(), self.data, theirs)
+            merged["version"] = theirs.get("version", 0) + 1
+            save_data(merged, self.path)
+            self._read()
+
+
+def _iter_file_rows(path):
+    """Lit un fichier CSV ou XLSX ligne par ligne"""
+    if path.lower().endswith(".xlsx"):
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield ["" if value is None else str(value) for value in row]
+        finally:
+            workbook.close()
+        return
+
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        try:
+            # Excel en français exporte les CSV avec des points-virgules
+            dialect = csv.Sniffer().sniff(f.read(4096), delimiters=";,\t")
+        except csv.Error:
+            dialect = csv.excel
+        f.seek(0)
+        yield from csv.reader(f, dialect)
+
+
+def iter_contact_rows(path):
+    """Parcourt un fichier de contacts et retourne (numéro de ligne, enregistrement)"""
+    rows = _iter_file_rows(path)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    columns = []
+    for name in header:
+        name = normalize_text(name).replace("_", " ")
+        name = COLUMN_ALIASES.get(name, name.replace(" ", "_"))
+        columns.append(name if name in EXCHANGE_COLUMNS else None)
+
+    for line_number, row in enumerate(rows, start=2):
+        record = {column: "" for column in EXCHANGE_COLUMNS}
+        for column, value in zip(columns, row):
+            if column:
+                record[column] = value.strip()
+        if any(record.values()):
+            yield line_number, record
+
+
+def import_contacts(data, path):
+    """Insère ou met à jour les contacts d'un fichier CSV/XLSX dans les données, sans les enregistrer
+
+    Un contact existant est retrouvé par son email, ou à défaut par (entreprise, nom, prénom) ;
+    s'il appartient à une autre entreprise que celle de la ligne, il y est déplacé.
+    Les données sont modifiées sur place : en cas d'erreur, elles peuvent être partiellement importées.
+    Retourne le nombre de contacts ajoutés, mis à jour, déplacés et la liste des lignes rejetées.
+    """
+    companies = {}
+    owners = {}
+    by_email = {}
+    by_name = {}
+    for company in data["entreprises"]:
+        key = company_key(company["nom"])
+        companies.setdefault(key, company)
+        for employee in company["personnel"]:
+            owners[id(employee)] = company
+            email = employee.get("email", "").lower()
+            if email:
+                by_email.setdefault(email, employee)
+            by_name.setdefault((key, normalize_text(employee["nom"]), normalize_text(employee["prenom"])), employee)
+
+    result = {"ajoutes": 0, "mis_a_jour": 0, "deplaces": 0, "rejets": []}
+    for line_number, record in iter_contact_rows(path):
+        # Une ligne sans contact ne met à jour que l'entreprise
+        has_contact = any(record[field] for field in ("nom", "prenom", "email"))
+        if not record["entreprise"]:
+            result["rejets"].append((line_number, "entreprise manquante"))
+            continue
+        if has_contact and not record["nom"]:
+            result["rejets"].append((line_number, "nom manquant"))
+            continue
+        # L'email est facultatif : un contact exporté sans email doit pouvoir être réimporté
+        if record["email"] and not EMAIL_PATTERN.match(record["email"]):
+            result["rejets"].append((line_number, f"email invalide : {record['email']}"))
+            continue
+
+        key = company_key(record["entreprise"])
+        company = companies.get(key)
+        if company is None:
+            company = {
+                "id": new_record_id(),
+                "nom": record["entreprise"],
+                "adresse": {field: "" for field in ADDRESS_FIELDS},
+                "personnel": []
+            }
+            data["entreprises"].append(company)
+            companies[key] = company
+        address = company.setdefault("adresse", {})
+        for field in ADDRESS_FIELDS:
+            if record[field]:
+                address[field] = record[field]
+        if not has_contact:
+            continue
+
+        email = record["email"].lower()
+        new_employee = {"nom": record["nom"], "prenom": record["prenom"]}
+        # Une ligne sans email ne doit pas effacer celui du contact existant
+        if record["email"]:
+            new_employee["email"] = record["email"]
+        name_key = (key, normalize_text(record["nom"]), normalize_text(record["prenom"]))
+        employee = (by_email.get(email) if email else None) or by_name.get(name_key)
+        if employee is not None:
+            previous = owners[id(employee)]
+            if previous is not company:
+                previous["personnel"].remove(employee)
+                company["personnel"].append(employee)
+                owners[id(employee)] = company
+                result["deplaces"] += 1
+            old_name_key = (company_key(previous["nom"]), normalize_text(employee["nom"]), normalize_text(employee["prenom"]))
+            if by_name.get(old_name_key) is employee:
+                del by_name[old_name_key]
+            employee.update(new_employee)
+            result["mis_a_jour"] += 1
+        else:
+            employee = dict(new_employee, id=new_record_id(), email=record["email"])
+            company["personnel"].append(employee)
+            owners[id(employee)] = company
+            result["ajoutes"] += 1
+        if email:
+            by_email[email] = employee
+        by_name[name_key] = employee
+
+    return result
+
+
+def _iter_export_rows(data):
+    for company in data["entreprises"]:
+        address = company.get("adresse", {})
+        company_values = [company["nom"]] + [address.get(field, "") for field in ADDRESS_FIELDS]
+        if not company["personnel"]:
+            yield company_values + ["", "", ""]
+        for employee in company["personnel"]:
+            yield company_values + [employee["nom"], employee["prenom"], employee.get("email", "")]
+
+
+def export_contacts(data, path):
+    """Exporte le carnet d'adresses, une ligne par contact, au format CSV ou XLSX"""
+    if path.lower().endswith(".xlsx"):
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Contacts")
+        sheet.append(EXCHANGE_COLUMNS)
+        for row in _iter_export_rows(data):
+            sheet.append(row)
+        workbook.save(path)
+        return
+
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(EXCHANGE_COLUMNS)
+        writer.writerows(_iter_export_rows(data))
 
 
 class ContactsApp:
     def __init__(self, root):
         self.root = root
-        self.data = load_data()
+        self.store = ContactStore()
+        self.data = self.store.data
         self.selection_index = None
+        self._search_index = []
+        self._search_texts = []
+        self._tree_items = []
+        self._row_parents = []
+        self._row_items = []
+        self._all_children = {}
+        self._attached = {}
+        self._open_items = set()
+        self._last_query = None
+        self._last_matches = None
+        self._search_job = None
         self.setup_ui()
         self.refresh_list()
-        self.email_pattern = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+        self.email_pattern = EMAIL_PATTERN
+        self.root.after(RELOAD_INTERVAL_MS, self.poll_changes)
+
+    def poll_changes(self):
+        """Recharge le carnet d'adresses lorsqu'une autre instance l'a modifié"""
+        try:
+            if self.store.reload_if_changed():
+                self.sync_from_store()
+                self.refresh_list()
+        finally:
+            self.root.after(RELOAD_INTERVAL_MS, self.poll_changes)
+
+    def sync_from_store(self):
+        """Reprend les données du carnet partagé en conservant l'entreprise sélectionnée"""
+        selected_id = None
+        if self.selection_index is not None and self.selection_index < len(self.data["entreprises"]):
+            selected_id = self.data["entreprises"][self.selection_index]["id"]
+
+        # Retrouver l'entreprise par son identifiant : elle a pu être renommée par une autre instance
+        self.data = self.store.data
+        self.selection_index = next(
+            (index for index, c in enumerate(self.data["entreprises"])
+             if c["id"] == selected_id),
+            None
+        ) if selected_id is not None else None
+
+    def commit(self):
+        """Enregistre les modifications en les fusionnant avec celles des autres instances"""
+        self.store.data = self.data
+        try:
+            self.store.commit()
+        except TimeoutError as e:
+            messagebox.showerror("Erreur", str(e))
+        self.sync_from_store()
 
     def setup_ui(self):
         style = ttk.Style()
@@ -41,6 +554,12 @@ class ContactsApp:
         self.left_frame = ttk.Frame(self.root, padding=10)
         self.left_frame.pack(side="left", fill="both", expand=True, padx=10, pady=10)
 
+        # Champ de recherche au-dessus de l'arborescence
+        self.search_var = ttk.StringVar()
+        self.search_entry = ttk.Entry(self.left_frame, textvariable=self.search_var)
+        self.search_entry.pack(side="top", fill="x", padx=10, pady=(10, 0))
+        self.search_var.trace_add('write', self.schedule_filter)
+
         self.tree = ttk.Treeview(self.left_frame, columns="info", show="tree")
         self.tree.configure(style="Custom.Treeview")
         self.tree.tag_configure("entreprise", font=("Segoe UI", 11, "bold"), foreground="#158cba")
@@ -111,6 +630,13 @@ class ContactsApp:
         )
         self.employee_action_button.grid(row=len(employee_labels), column=1, sticky="e", pady=10)
 
+        # Import et export en masse
+        exchange_frame = ttk.Frame(self.right_frame)
+        exchange_frame.pack(fill="x", padx=10)
+
+        ttk.Button(exchange_frame, text="Exporter…", command=self.export_file).pack(side="right")
+        ttk.Button(exchange_frame, text="Importer…", command=self.import_file).pack(side="right", padx=(0, 10))
+
         # Ajouter une validation sur les champs entreprise
         for entry in self.company_entries:
             entry.bind('<KeyRelease>', self.validate_company_form)
@@ -134,15 +660,110 @@ class ContactsApp:
         self.employee_action_button.configure(state=state)
 
     def refresh_list(self):
+        self.build_search_index()
+        self.apply_filter()
+
+    def build_search_index(self):
+        """Crée toutes les lignes de l'arborescence et précalcule, dans l'ordre d'affichage, leur texte normalisé
+
+        Le filtrage se contente ensuite de détacher et de rattacher ces lignes.
+        """
+        self._search_index = []
+        self._tree_items = []
+        self._last_query = None
+        self._last_matches = None
         self.tree.delete(*self.tree.get_children())
 
         sorted_companies = sorted(self.data["entreprises"], key=lambda c: c["nom"].upper())
 
         for company in sorted_companies:
-            item = self.tree.insert("", "end", text=company["nom"], tags=("entreprise",))
+            company_text = normalize_text(f'{company["nom"]} {company.get("adresse", {}).get("ville", "")}')
+            company_item = self.tree.insert("", "end", text=company["nom"], tags=("entreprise",))
+            self._search_index.append((company, None, company_text))
+            self._tree_items.append((company_item, ""))
             sorted_employees = sorted(company["personnel"], key=lambda e: e["nom"].upper())
             for employee in sorted_employees:
-                self.tree.insert(item, "end", text=(f'👤 {employee["nom"].upper()} {employee["prenom"]}'))
+                employee_text = normalize_text(f'{employee["nom"]} {employee["prenom"]} {employee.get("email", "")}')
+                item = self.tree.insert(company_item, "end", text=(f'👤 {employee["nom"].upper()} {employee["prenom"]}'))
+                self._search_index.append((company, employee, f'{company_text} {employee_text}'))
+                self._tree_items.append((item, company_item))
+
+        self._search_texts = [text for _, _, text in self._search_index]
+        # Lignes rattachées à chaque parent ; le filtrage ne remplace que les listes qui changent
+        children = {"": []}
+        for item, parent in self._tree_items:
+            if not parent:
+                children[item] = []
+            children[parent].append(item)
+        self._all_children = {parent: tuple(items) for parent, items in children.items()}
+        self._attached = dict(self._all_children)
+        self._open_items = set()
+
+        # Pour chaque position de l'index : l'entreprise, et la ligne du contact (None pour l'entreprise)
+        self._row_parents = [parent or item for item, parent in self._tree_items]
+        self._row_items = [item if parent else None for item, parent in self._tree_items]
+
+    def schedule_filter(self, *args):
+        """Relance le filtrage après une courte pause dans la saisie"""
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(SEARCH_DELAY_MS, self.apply_filter)
+
+    def filter_index(self, query):
+        """Retourne les positions de l'index correspondant à tous les termes de la recherche"""
+        terms = query.split()
+        if not terms:
+            return range(len(self._search_index))
+
+        texts = self._search_texts
+
+        # Si la recherche prolonge la précédente, seuls ses résultats peuvent encore correspondre
+        if self._last_matches is not None and query.startswith(self._last_query):
+            matches = self._last_matches
+        else:
+            first_term = terms.pop(0)
+            matches = [i for i, text in enumerate(texts) if first_term in text]
+
+        for term in terms:
+            matches = [i for i in matches if term in texts[i]]
+        return matches
+
+    def apply_filter(self):
+        self._search_job = None
+        query = normalize_text(self.search_var.get())
+        matches = self.filter_index(query)
+        self._last_query = query
+        self._last_matches = matches if query else None
+
+        # Lignes à afficher, par parent et dans l'ordre : une entreprise reste affichée dès qu'un de ses contacts correspond
+        if not query:
+            visible = self._all_children
+        else:
+            companies = []
+            visible = {"": companies}
+            # Les positions sont croissantes : les lignes d'une même entreprise se suivent
+            for parent, positions in groupby(matches, self._row_parents.__getitem__):
+                companies.append(parent)
+                visible[parent] = tuple(filter(None, map(self._row_items.__getitem__, positions)))
+
+        # Une seule commande Tk par liste modifiée : les lignes absentes de la nouvelle liste sont détachées,
+        # les autres rattachées dans l'ordre. Les entreprises masquées gardent leurs contacts tels quels.
+        for parent, items in visible.items():
+            items = tuple(items)
+            if self._attached[parent] is not items and self._attached[parent] != items:
+                self.tree.set_children(parent, *items)
+                self._attached[parent] = items
+
+        # Déplier les entreprises pour montrer les contacts trouvés, les replier quand la recherche est vidée
+        if query:
+            opening = [item for item in visible[""] if item not in self._open_items]
+            for item in opening:
+                self.tree.item(item, open=True)
+            self._open_items.update(opening)
+        else:
+            for item in self._open_items:
+                self.tree.item(item, open=False)
+            self._open_items = set()
 
     def on_tree_select(self, event):
         selection = self.tree.selection()
@@ -247,6 +868,7 @@ class ContactsApp:
     def add_update_company(self):
         # Récupérer les valeurs des champs
         new_company = {
+            "id": new_record_id(),
             "nom": self.c_name_entry.get(),
             "adresse": {
                 "rue": self.c_street_entry.get(),
@@ -259,16 +881,24 @@ class ContactsApp:
 
         if self.selection_index is not None:
             # Mode modification
-            # Préserver la liste du personnel existant
+            # Préserver l'identifiant et la liste du personnel existant
+            new_company["id"] = self.data["entreprises"][self.selection_index]["id"]
             new_company["personnel"] = self.data["entreprises"][self.selection_index]["personnel"]
             self.data["entreprises"][self.selection_index] = new_company
         else:
             # Mode ajout
+            # Refuser une entreprise déjà présente sous un nom équivalent
+            key = company_key(new_company["nom"])
+            existing = next((c for c in self.data["entreprises"] if company_key(c["nom"]) == key), None)
+            if existing:
+                messagebox.showwarning("Doublon", f"L'entreprise « {existing['nom']} » existe déjà.")
+                return
+
             new_company["personnel"] = []  # Initialiser une liste vide pour le personnel
             self.data["entreprises"].append(new_company)
 
         # Sauvegarder les données
-        save_data(self.data)
+        self.commit()
 
         # Rafraîchir l'affichage
         self.refresh_list()
@@ -314,6 +944,7 @@ class ContactsApp:
 
         # Récupérer les valeurs des champs
         new_employee = {
+            "id": new_record_id(),
             "nom": self.employee_entries[0].get().strip(),
             "prenom": self.employee_entries[1].get().strip(),
             "email": self.employee_entries[2].get().strip()
@@ -330,14 +961,21 @@ class ContactsApp:
                 None
             )
             if employee_index is not None:
-                # Mettre à jour l'employé existant
+                # Mettre à jour l'employé existant en conservant son identifiant
+                new_employee["id"] = personnel[employee_index]["id"]
                 self.data["entreprises"][self.selection_index]["personnel"][employee_index] = new_employee
         else:
+            # Refuser un email déjà présent dans l'entreprise
+            personnel = self.data["entreprises"][self.selection_index]["personnel"]
+            if any(employee.get("email", "").lower() == new_employee["email"].lower() for employee in personnel):
+                messagebox.showwarning("Doublon", f"Le contact {new_employee['email']} existe déjà.")
+                return
+
             # Ajouter le nouvel employé
             self.data["entreprises"][self.selection_index]["personnel"].append(new_employee)
 
         # Sauvegarder les données
-        save_data(self.data)
+        self.commit()
 
         # Rafraîchir l'affichage
         self.refresh_list()
@@ -347,6 +985,45 @@ class ContactsApp:
             entry.delete(0, 'end')
         self.employee_action_button.configure(text="Ajouter")
 
+    def import_file(self):
+        """Importe un fichier CSV/XLSX de contacts puis enregistre une seule fois"""
+        path = filedialog.askopenfilename(
+            title="Importer des contacts",
+            filetypes=[("Fichiers de contacts", "*.csv *.xlsx"), ("CSV", "*.csv"), ("Excel", "*.xlsx")]
+        )
+        if not path:
+            return
+
+        # Importer dans une copie : une erreur en cours de fichier ne laisse pas d'import partiel
+        data = copy.deepcopy(self.data)
+        try:
+            result = import_contacts(data, path)
+        except Exception as e:
+            messagebox.showerror("Erreur", f"Erreur lors de l'import : {str(e)}")
+            return
+
+        self.data = data
+        self.commit()
+        self.refresh_list()
+
+        message = f"{result['ajoutes']} contact(s) ajouté(s), {result['mis_a_jour']} mis à jour"
+        if result["deplaces"]:
+            message += f" dont {result['deplaces']} changé(s) d'entreprise"
+        message += "."
+        if result["rejets"]:
+            details = "\n".join(f"Ligne {line} : {reason}" for line, reason in result["rejets"][:10])
+            message += f"\n\n{len(result['rejets'])} ligne(s) rejetée(s) :\n{details}"
+        messagebox.showinfo("Import", message)
+
+    def export_file(self):
+        path = filedialog.asksaveasfilename(
+            title="Exporter les contacts",
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("Excel", "*.xlsx")]
+        )
+        if path:
+            export_contacts(self.data, path)
+
 
 if __name__ == "__main__":
     app = ttk.Window(title="Gestion des contacts", size=(1000, 550), resizable=(False, False))
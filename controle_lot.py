@@ -0,0 +1,150 @@
+"""Contrôle préalable d'un lot de classeurs avant la génération des bordereaux.
+
+Tous les classeurs sont lus et validés en parallèle avec les mêmes règles
+que le formulaire. Le rapport consolidé est affiché dans la console et peut
+être enregistré au format JSON. Avec --generer, les bordereaux des seuls
+classeurs sans anomalie sont ensuite générés dans le dossier indiqué.
+
+Usage : python controle_lot.py DOSSIER_OU_FICHIERS... [--json rapport.json] [--workers N]
+                               [--generer DOSSIER --statut BPE]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from generer_pdf import generate_batch
+from lecture_excel import ExcelDocument, build_form_data, read_workbook, validate_workbook_data
+
+
+def check_workbook(path):
+    """Extrait et valide un classeur ; retourne son entrée du rapport."""
+    try:
+        data = read_workbook(path, with_files=False)
+    except KeyError as e:
+        return {"file": path, "errors": [f"Feuille introuvable : {e}"]}
+    except Exception as e:
+        return {"file": path, "errors": [f"Lecture impossible : {e}"]}
+    return {"file": path, "errors": validate_workbook_data(data)}
+
+
+def collect_workbooks(paths):
+    """Développe les dossiers en liste de classeurs .xlsx."""
+    workbooks = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, filenames in os.walk(path):
+                workbooks.extend(
+                    os.path.join(root, filename) for filename in sorted(filenames)
+                    if filename.lower().endswith(ExcelDocument.XLSX_EXTENSION)
+                    and not filename.startswith("~$")  # Fichiers de verrouillage Excel
+                )
+        else:
+            workbooks.append(path)
+    return workbooks
+
+
+def preflight(paths, workers=None):
+    """Valide tous les classeurs en parallèle et retourne le rapport consolidé."""
+    workbooks = collect_workbooks(paths)
+    start = time.perf_counter()
+
+    if len(workbooks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(check_workbook, workbooks, chunksize=4))
+    else:
+        results = [check_workbook(path) for path in workbooks]
+
+    report = {
+        "total": len(results),
+        "duration": round(time.perf_counter() - start, 3),
+        "results": results
+    }
+    _count_results(report)
+    return report
+
+
+def _count_results(report):
+    invalid = sum(1 for result in report["results"] if result["errors"])
+    report["valid"] = report["total"] - invalid
+    report["invalid"] = invalid
+
+
+def clean_workbooks(report):
+    """Retourne les classeurs du rapport qui peuvent passer à la génération."""
+    return [result["file"] for result in report["results"] if not result["errors"]]
+
+
+def generate_documents(report, output_dir, status, sidecars=True):
+    """Génère les bordereaux des classeurs conformes du rapport, lus un par un avec leur feuille 'Fichiers'.
+
+    Un classeur qui ne peut être lu ou rendu n'interrompt pas le lot : l'erreur
+    est ajoutée à son entrée du rapport. Retourne la liste des PDF générés.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    entries = {result["file"]: result for result in report["results"]}
+    read_paths = []
+
+    def documents_data():
+        for path in clean_workbooks(report):
+            try:
+                form_data = build_form_data(read_workbook(path), status, excel_file=path)
+            except Exception as e:
+                entries[path]["errors"].append(f"Lecture impossible : {e}")
+                continue
+            read_paths.append(path)
+            yield form_data
+
+    generated = []
+    for path, result in zip(read_paths, generate_batch(documents_data(), output_dir, sidecars=sidecars)):
+        if result["error"]:
+            entries[path]["errors"].append(f"Génération impossible : {result['error']}")
+        else:
+            generated.append(result["pdf"])
+
+    _count_results(report)
+    return generated
+
+
+def print_report(report):
+    for result in report["results"]:
+        if result["errors"]:
+            print(f"✗ {result['file']}")
+            for error in result["errors"]:
+                print(f"    - {error}")
+    print(
+        f"\n{report['total']} classeur(s) contrôlé(s) en {report['duration']} s : "
+        f"{report['valid']} conforme(s), {report['invalid']} en anomalie"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Contrôle préalable d'un lot de classeurs")
+    parser.add_argument("paths", nargs="+", help="Classeurs ou dossiers à contrôler")
+    parser.add_argument("--json", dest="json_path", help="Chemin du rapport JSON")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processus")
+    parser.add_argument("--generer", dest="output_dir", help="Dossier où générer les bordereaux conformes")
+    parser.add_argument("--statut", choices=list(ExcelDocument.STATUS), help="Statut des bordereaux générés")
+    parser.add_argument("--sans-annexes", dest="sidecars", action="store_false",
+                        help="Ne pas écrire le manifeste JSON ni la liste CSV")
+    args = parser.parse_args(argv)
+    if args.output_dir and not args.statut:
+        parser.error("--statut est obligatoire avec --generer")
+
+    report = preflight(args.paths, workers=args.workers)
+    if args.output_dir:
+        paths = generate_documents(report, args.output_dir, args.statut, args.sidecars)
+    print_report(report)
+    if args.output_dir:
+        print(f"{len(paths)} bordereau(x) généré(s) dans {args.output_dir}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    return 1 if report["invalid"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
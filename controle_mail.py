@@ -0,0 +1,235 @@
+"""Contrôle du comportement de l'envoi des mails sur un serveur SMTP factice.
+
+Un serveur SMTP minimal (socketserver, sans dépendance au module smtpd
+retiré de Python 3.12) est démarré en local. Il compte les connexions et
+les transmissions, et refuse les messages de certains destinataires avec
+un code définitif (5xx) ou temporaire (4xx). Le script échoue (code de
+sortie 1) si un lot utilise plus d'une connexion ou si un refus n'aboutit
+pas au comportement attendu dans la boîte d'envoi, ou si les messages de
+la boîte d'envoi ne sont pas renvoyés au lot suivant.
+
+Usage : python controle_mail.py
+"""
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+from email.message import EmailMessage
+from envoi_mail import MailSender, send_messages
+
+# Destinataires refusés par le serveur à la fin de la transmission (DATA)
+PERMANENT_REFUSAL = "refus.definitif@exemple.fr"
+TEMPORARY_REFUSAL = "refus.temporaire@exemple.fr"
+REPLIES = {
+    PERMANENT_REFUSAL: b"554 5.7.1 Message refuse\r\n",
+    TEMPORARY_REFUSAL: b"451 4.3.0 Reessayer plus tard\r\n",
+}
+
+BATCH_SIZE = 50
+MAX_RETRIES = 2
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    """Serveur SMTP factice qui tient le compte des connexions et des transmissions."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubSMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.attempts = {}
+        self.accepted = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.attempts = {}
+            self.accepted = 0
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.wfile.write(b"220 stub ESMTP\r\n")
+
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250 stub\r\n")
+            elif verb == "MAIL":
+                recipients = []
+                self.wfile.write(b"250 OK\r\n")
+            elif verb == "RCPT":
+                recipients.append(command.partition(":")[2].strip(" <>").lower())
+                self.wfile.write(b"250 OK\r\n")
+            elif verb == "DATA":
+                self.wfile.write(b"354 Fin par <CRLF>.<CRLF>\r\n")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.wfile.write(self._data_reply(recipients))
+            elif verb in ("RSET", "NOOP"):
+                recipients = []
+                self.wfile.write(b"250 OK\r\n")
+            elif verb == "QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            else:
+                self.wfile.write(b"502 Commande inconnue\r\n")
+
+    def _data_reply(self, recipients):
+        server = self.server
+        with server.lock:
+            for recipient in recipients:
+                server.attempts[recipient] = server.attempts.get(recipient, 0) + 1
+            for recipient in recipients:
+                if recipient in REPLIES:
+                    return REPLIES[recipient]
+            server.accepted += 1
+        return b"250 OK\r\n"
+
+
+def build_test_message(recipient, index):
+    message = EmailMessage()
+    message["From"] = "bordereaux@exemple.fr"
+    message["To"] = recipient
+    message["Subject"] = f"Bordereau d'envoi BE-{index:04d}"
+    message.set_content("Bordereau de test")
+    return message
+
+
+def send_batch(server, outbox, recipients):
+    """Envoie un lot sur le serveur factice et retourne l'expéditeur utilisé."""
+    server.reset()
+    mail_sender = MailSender(
+        "127.0.0.1", server.port, sender="bordereaux@exemple.fr", timeout=5,
+        max_retries=MAX_RETRIES, backoff=0.01, outbox=outbox
+    )
+    with mail_sender:
+        for index, recipient in enumerate(recipients):
+            mail_sender.submit(build_test_message(recipient, index))
+    return mail_sender
+
+
+def outbox_count(outbox):
+    if not os.path.isdir(outbox):
+        return 0
+    return sum(1 for filename in os.listdir(outbox) if filename.endswith(".eml"))
+
+
+def check_batch(server, directory):
+    """Un lot sans refus passe par une seule connexion."""
+    outbox = os.path.join(directory, "lot")
+    recipients = [f"contact{i}@exemple.fr" for i in range(BATCH_SIZE)]
+    mail_sender = send_batch(server, outbox, recipients)
+
+    failures = []
+    if server.connections != 1:
+        failures.append(f"lot : {server.connections} connexions pour {BATCH_SIZE} messages (attendu 1)")
+    if mail_sender.sent != BATCH_SIZE or server.accepted != BATCH_SIZE:
+        failures.append(f"lot : {server.accepted}/{BATCH_SIZE} messages reçus par le serveur")
+    if outbox_count(outbox):
+        failures.append("lot : des messages ont été placés dans la boîte d'envoi")
+    return failures
+
+
+def check_permanent_refusal(server, directory):
+    """Un refus 5xx n'est pas retenté, le message va dans la boîte d'envoi et le lot continue."""
+    outbox = os.path.join(directory, "definitif")
+    recipients = ["avant@exemple.fr", PERMANENT_REFUSAL, "apres@exemple.fr"]
+    mail_sender = send_batch(server, outbox, recipients)
+
+    failures = []
+    if server.connections != 1:
+        failures.append(f"5xx : {server.connections} connexions (attendu 1)")
+    if server.attempts.get(PERMANENT_REFUSAL) != 1:
+        failures.append(f"5xx : {server.attempts.get(PERMANENT_REFUSAL)} tentatives (attendu 1)")
+    if mail_sender.sent != 2 or len(mail_sender.failed) != 1:
+        failures.append(f"5xx : {mail_sender.sent} envoyé(s), {len(mail_sender.failed)} en échec (attendu 2 et 1)")
+    if outbox_count(outbox) != 1:
+        failures.append(f"5xx : {outbox_count(outbox)} message(s) dans la boîte d'envoi (attendu 1)")
+    return failures
+
+
+def check_temporary_refusal(server, directory):
+    """Un refus 4xx est retenté jusqu'à la limite puis placé dans la boîte d'envoi."""
+    outbox = os.path.join(directory, "temporaire")
+    mail_sender = send_batch(server, outbox, [TEMPORARY_REFUSAL])
+
+    failures = []
+    expected = MAX_RETRIES + 1
+    if server.attempts.get(TEMPORARY_REFUSAL) != expected:
+        failures.append(f"4xx : {server.attempts.get(TEMPORARY_REFUSAL)} tentatives (attendu {expected})")
+    if len(mail_sender.failed) != 1:
+        failures.append(f"4xx : {len(mail_sender.failed)} message(s) en échec (attendu 1)")
+    if outbox_count(outbox) != 1:
+        failures.append(f"4xx : {outbox_count(outbox)} message(s) dans la boîte d'envoi (attendu 1)")
+    return failures
+
+
+def check_outbox_flush(server, directory):
+    """Le lot suivant renvoie d'abord les messages de la boîte d'envoi, sur la même connexion."""
+    outbox = os.path.join(directory, "renvoi")
+    MailSender("127.0.0.1", outbox=outbox)._save_to_outbox(build_test_message("attente@exemple.fr", 0))
+
+    server.reset()
+    mail_sender = send_messages(
+        [build_test_message("nouveau@exemple.fr", 1)],
+        {"host": "127.0.0.1", "port": server.port, "sender": "bordereaux@exemple.fr", "timeout": 5},
+        outbox=outbox
+    )
+
+    failures = []
+    if server.connections != 1:
+        failures.append(f"renvoi : {server.connections} connexions (attendu 1)")
+    if server.attempts.get("attente@exemple.fr") != 1 or mail_sender.sent != 2:
+        failures.append(f"renvoi : {mail_sender.sent} message(s) envoyé(s) (attendu 2)")
+    if outbox_count(outbox):
+        failures.append(f"renvoi : {outbox_count(outbox)} message(s) restés dans la boîte d'envoi (attendu 0)")
+    return failures
+
+
+CHECKS = (check_batch, check_permanent_refusal, check_temporary_refusal, check_outbox_flush)
+
+
+def main():
+    failures = []
+    server = StubSMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for check in CHECKS:
+                found = check(server, directory)
+                print(f"{check.__name__:<26} {'échec' if found else 'ok'}")
+                failures.extend(found)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if failures:
+        print("\nÉchecs :")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+
+    print("\nL'envoi des mails se comporte comme attendu.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Mesure de la latence du filtre de recherche du carnet d'adresses.
+
+Un carnet d'adresses synthétique est ouvert dans une vraie fenêtre
+ContactsApp. Chaque requête est appliquée comme si elle venait d'être
+saisie, puis la fenêtre est redessinée ; le temps mesuré comprend donc le
+filtrage, les commandes Tk et le rafraîchissement de l'arborescence. Le
+script échoue (code de sortie 1) si une requête dépasse la latence
+maximale. Un affichage est nécessaire (DISPLAY sous Linux).
+
+Usage : python controle_recherche.py [--contacts 50000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import ttkbootstrap as ttk
+import contacts
+from budget_memoire import build_contacts
+
+MAX_LATENCY_MS = 20
+
+# Frappe d'une recherche caractère par caractère, puis effacement, recherches larges et collage
+QUERIES = (
+    [("frappe", "entreprise 12"[:length]) for length in range(1, 14)]
+    + [("effacement", ""), ("large", "prenom3"), ("effacement", ""),
+       ("collage", "contact4.5"), ("large", "nancy"), ("effacement", "")]
+)
+
+
+def measure(app, query):
+    """Applique une requête et retourne le temps écoulé jusqu'au rafraîchissement, en millisecondes."""
+    app.search_var.set(query)
+    # La saisie a programmé un filtrage différé : le mesurer immédiatement
+    if app._search_job is not None:
+        app.root.after_cancel(app._search_job)
+    start = time.perf_counter()
+    app.apply_filter()
+    app.root.update()
+    return (time.perf_counter() - start) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latence du filtre de recherche des contacts")
+    parser.add_argument("--contacts", type=int, default=50_000, help="Nombre de contacts du carnet")
+    args = parser.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = build_contacts(args.contacts, directory)
+        os.replace(path, os.path.join(directory, contacts.FICHIER_JSON))
+        previous_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            root = ttk.Window()
+            app = contacts.ContactsApp(root)
+            root.update()
+            for kind, query in QUERIES:
+                latency = measure(app, query)
+                print(f"{kind:<11} {query!r:<18} {latency:8.1f} ms")
+                if latency > MAX_LATENCY_MS:
+                    failures.append(f"{query!r} : {latency:.1f} ms (maximum {MAX_LATENCY_MS} ms)")
+            root.destroy()
+        finally:
+            os.chdir(previous_directory)
+
+    if failures:
+        print("\nÉchecs :")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+
+    print(f"\nToutes les requêtes sont filtrées en moins de {MAX_LATENCY_MS} ms.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
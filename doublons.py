@@ -0,0 +1,250 @@
+"""Détection et fusion des doublons du carnet d'adresses.
+
+Les entreprises ne sont comparées qu'à l'intérieur de blocs de candidats
+plausibles (même début de nom normalisé, même domaine d'email ou même code
+postal) au lieu de l'ensemble des paires. Chaque paire reçoit un score de
+similarité ; les paires retenues peuvent être fusionnées en un seul passage
+sans perdre aucun contact. Seules les entreprises de même nom normalisé sont
+fusionnées d'office ; les noms seulement proches (« SNCF RESEAU NANCY » et
+« SNCF GARES NANCY ») sont soumis à confirmation.
+
+Usage : python doublons.py [--seuil 0.9] [--fusionner]
+"""
+import argparse
+import sys
+from collections import defaultdict
+from difflib import SequenceMatcher
+from contacts import ContactStore, normalize_text, company_key
+
+DEFAULT_THRESHOLD = 0.9
+# Le code postal ou un email communs ne départagent que des noms déjà à moins de cet écart du seuil
+TIE_BREAK_MARGIN = 0.05
+PREFIX_LENGTH = 6
+# Au-delà, un bloc (domaine très répandu, code postal d'une grande ville...) n'est pas discriminant
+MAX_BLOCK_SIZE = 200
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def _email_domain(email):
+    return email.rpartition("@")[2] if "@" in email else ""
+
+
+def _company_profile(company):
+    """Précalcule les éléments de comparaison d'une entreprise."""
+    key = company_key(company["nom"])
+    emails = {normalize_email(e.get("email")) for e in company["personnel"]} - {""}
+    return {
+        "key": key,
+        "compact": key.replace(" ", ""),
+        "postal_code": (company.get("adresse", {}).get("code_postal") or "").strip(),
+        "emails": emails,
+        "domains": {_email_domain(email) for email in emails} - {""},
+    }
+
+
+def _blocking_keys(profile):
+    keys = set()
+    if profile["compact"]:
+        keys.add(("nom", profile["compact"]))
+        keys.add(("prefixe", profile["compact"][:PREFIX_LENGTH]))
+    for domain in profile["domains"]:
+        keys.add(("domaine", domain))
+    if profile["postal_code"]:
+        keys.add(("code_postal", profile["postal_code"]))
+    return keys
+
+
+def similarity(first, second, threshold=DEFAULT_THRESHOLD):
+    """Score de similarité entre deux profils d'entreprise, entre 0 et 1."""
+    if first["key"] == second["key"]:
+        return 1.0
+    score = SequenceMatcher(None, first["key"], second["key"]).ratio()
+    # Deux entreprises d'une même ville partagent leur code postal : cela ne suffit pas à les confondre
+    if score < threshold - TIE_BREAK_MARGIN:
+        return score
+    if first["postal_code"] and first["postal_code"] == second["postal_code"]:
+        score += 0.1
+    if first["emails"] & second["emails"]:
+        score += 0.1
+    return min(score, 1.0)
+
+
+def find_duplicate_companies(data, threshold=DEFAULT_THRESHOLD):
+    """Retourne les paires (index, index, score) d'entreprises probablement en double."""
+    companies = data["entreprises"]
+    profiles = [_company_profile(company) for company in companies]
+
+    blocks = defaultdict(list)
+    for index, profile in enumerate(profiles):
+        for key in _blocking_keys(profile):
+            blocks[key].append(index)
+
+    compared = set()
+    pairs = []
+    for (kind, _), members in blocks.items():
+        # Les noms identiques sont toujours comparés, quelle que soit la taille du bloc
+        if len(members) < 2 or (len(members) > MAX_BLOCK_SIZE and kind != "nom"):
+            continue
+        for position, first in enumerate(members):
+            for second in members[position + 1:]:
+                if (first, second) in compared:
+                    continue
+                compared.add((first, second))
+                # Comparaison rapide avant le calcul complet du score
+                if SequenceMatcher(None, profiles[first]["key"], profiles[second]["key"]).real_quick_ratio() < threshold - 0.2:
+                    continue
+                score = similarity(profiles[first], profiles[second], threshold)
+                if score >= threshold:
+                    pairs.append((first, second, round(score, 3)))
+
+    return sorted(pairs, key=lambda pair: -pair[2])
+
+
+def find_duplicate_emails(data):
+    """Retourne les emails présents plusieurs fois, avec leurs positions (entreprise, contact)."""
+    positions = defaultdict(list)
+    for company_index, company in enumerate(data["entreprises"]):
+        for employee_index, employee in enumerate(company["personnel"]):
+            email = normalize_email(employee.get("email"))
+            if email:
+                positions[email].append((company_index, employee_index))
+    return {email: found for email, found in positions.items() if len(found) > 1}
+
+
+def _group_pairs(count, pairs):
+    """Regroupe les paires en ensembles d'entreprises à fusionner (union-find)."""
+    parent = list(range(count))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    for first, second, _ in pairs:
+        root_first, root_second = find(first), find(second)
+        if root_first != root_second:
+            parent[max(root_first, root_second)] = min(root_first, root_second)
+
+    groups = defaultdict(list)
+    for index in range(count):
+        groups[find(index)].append(index)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def _person_name(employee):
+    return normalize_text(employee["nom"]), normalize_text(employee["prenom"])
+
+
+def _merge_personnel(target, employees):
+    """Ajoute les contacts absents de la cible.
+
+    Un contact n'est fusionné que si son email et son nom correspondent : une
+    adresse générique (contact@, accueil@...) peut être partagée par plusieurs
+    personnes, qui sont alors conservées et signalées comme emails en double.
+    """
+    by_identity = {(normalize_email(e.get("email")), _person_name(e)): e
+                   for e in target if normalize_email(e.get("email"))}
+    by_name = {_person_name(e): e for e in target}
+
+    for employee in employees:
+        email = normalize_email(employee.get("email"))
+        name = _person_name(employee)
+        existing = by_identity.get((email, name)) if email else by_name.get(name)
+        if existing is not None:
+            # Compléter les champs vides du contact déjà présent
+            for field, value in employee.items():
+                if value and not existing.get(field):
+                    existing[field] = value
+            continue
+
+        employee = dict(employee)
+        target.append(employee)
+        if email:
+            by_identity[(email, name)] = employee
+        by_name.setdefault(name, employee)
+
+
+def merge_duplicates(data, pairs):
+    """Fusionne les entreprises des paires données et retourne le nombre d'entreprises supprimées."""
+    companies = data["entreprises"]
+    removed = set()
+
+    for members in _group_pairs(len(companies), pairs):
+        # L'entreprise conservée est celle qui compte le plus de contacts
+        members.sort(key=lambda index: (-len(companies[index]["personnel"]), index))
+        target = companies[members[0]]
+        address = target.setdefault("adresse", {})
+        for index in members[1:]:
+            other = companies[index]
+            for field, value in other.get("adresse", {}).items():
+                if value and not address.get(field):
+                    address[field] = value
+            _merge_personnel(target["personnel"], other["personnel"])
+            removed.add(index)
+
+    data["entreprises"] = [company for index, company in enumerate(companies) if index not in removed]
+    return len(removed)
+
+
+def _confirm(first_name, second_name):
+    """Demande la confirmation d'une fusion ; refusée si la console n'est pas interactive."""
+    if not sys.stdin.isatty():
+        print(f"À vérifier, non fusionné : {first_name}  ↔  {second_name}")
+        return False
+    answer = input(f"Fusionner « {first_name} » et « {second_name} » ? [o/N] ")
+    return answer.strip().lower() in ("o", "oui")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Détection des doublons du carnet d'adresses")
+    parser.add_argument("--seuil", type=float, default=DEFAULT_THRESHOLD, help="Score minimal d'un doublon")
+    parser.add_argument("--fusionner", action="store_true", help="Fusionner les doublons et enregistrer")
+    args = parser.parse_args(argv)
+
+    store = ContactStore()
+    data = store.data
+    companies = data["entreprises"]
+
+    pairs = find_duplicate_companies(data, args.seuil)
+    for first, second, score in pairs:
+        print(f"{score:.2f}  {companies[first]['nom']}  ↔  {companies[second]['nom']}")
+
+    # Seuls les noms identiques une fois normalisés sont fusionnés sans confirmation
+    to_merge = [pair for pair in pairs
+                if company_key(companies[pair[0]]["nom"]) == company_key(companies[pair[1]]["nom"])]
+    if args.fusionner:
+        for pair in pairs:
+            if pair not in to_merge and _confirm(companies[pair[0]]["nom"], companies[pair[1]]["nom"]):
+                to_merge.append(pair)
+
+    if args.fusionner and to_merge:
+        count = merge_duplicates(data, to_merge)
+        # Fusionner avec les modifications enregistrées entre-temps par l'application
+        try:
+            store.commit()
+        except TimeoutError as e:
+            print(e, file=sys.stderr)
+            return 1
+        data = store.data
+        print(f"{count} entreprise(s) fusionnée(s)")
+
+    # Après une fusion, le rapport liste aussi les personnes conservées malgré un email partagé
+    companies = data["entreprises"]
+    for email, positions in find_duplicate_emails(data).items():
+        names = ", ".join(
+            f'{companies[company_index]["personnel"][employee_index]["nom"].upper()} '
+            f'{companies[company_index]["personnel"][employee_index]["prenom"]} '
+            f'({companies[company_index]["nom"]})'
+            for company_index, employee_index in positions
+        )
+        print(f"Email en double : {email} : {names}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+"""Report du numéro, de la date et du statut dans la page de garde du classeur.
+
+Plutôt que de recharger puis réenregistrer le classeur avec openpyxl (lent et
+susceptible de perdre une partie de la mise en forme), seul le XML de la page
+de garde est modifié. Tous les autres membres de l'archive .xlsx sont recopiés
+octet pour octet, sans décompression ni recompression.
+"""
+import os
+import re
+import shutil
+import struct
+import tempfile
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+from lecture_excel import InformationExcelCells
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+WORKBOOK_XML = "xl/workbook.xml"
+WORKBOOK_RELS = "xl/_rels/workbook.xml.rels"
+CONTENT_TYPES = "[Content_Types].xml"
+CALC_CHAIN = "xl/calcChain.xml"
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+END_OF_CENTRAL_DIR = struct.Struct("<4s4H2LH")
+LOCAL_SIGNATURE = b"PK\x03\x04"
+CENTRAL_SIGNATURE = b"PK\x01\x02"
+END_SIGNATURE = b"PK\x05\x06"
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+class _ZipEntry:
+    """Entrée du répertoire central d'une archive zip."""
+
+    def __init__(self, name, fields, name_bytes, extra, comment):
+        self.name = name
+        self.fields = fields
+        self.name_bytes = name_bytes
+        self.extra = extra
+        self.comment = comment
+
+    @property
+    def flags(self):
+        return self.fields[3]
+
+    @property
+    def compressed_size(self):
+        return self.fields[8]
+
+    @property
+    def local_offset(self):
+        return self.fields[16]
+
+    def central_record(self, **changes):
+        """Reconstruit l'enregistrement du répertoire central avec les champs modifiés."""
+        fields = list(self.fields)
+        positions = {'version_needed': 2, 'flags': 3, 'method': 4, 'crc': 7,
+                     'compressed_size': 8, 'size': 9, 'local_offset': 16}
+        extra = changes.pop('extra', self.extra)
+        for key, value in changes.items():
+            fields[positions[key]] = value
+        fields[10], fields[11], fields[12] = len(self.name_bytes), len(extra), len(self.comment)
+        return CENTRAL_HEADER.pack(*fields) + self.name_bytes + extra + self.comment
+
+
+def _read_central_directory(f):
+    """Lit le répertoire central et le commentaire de l'archive."""
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    tail_size = min(file_size, END_OF_CENTRAL_DIR.size + 0xFFFF)
+    f.seek(file_size - tail_size)
+    tail = f.read(tail_size)
+
+    position = tail.rfind(END_SIGNATURE)
+    if position < 0:
+        raise zipfile.BadZipFile("Fin du répertoire central introuvable")
+    end = END_OF_CENTRAL_DIR.unpack_from(tail, position)
+    entries_count, directory_size, directory_offset = end[4], end[5], end[6]
+    if entries_count == 0xFFFF or 0xFFFFFFFF in (directory_size, directory_offset):
+        raise zipfile.BadZipFile("Les archives ZIP64 ne sont pas prises en charge")
+    comment = tail[position + END_OF_CENTRAL_DIR.size:position + END_OF_CENTRAL_DIR.size + end[7]]
+
+    f.seek(directory_offset)
+    directory = f.read(directory_size)
+    entries = []
+    offset = 0
+    while offset < len(directory):
+        fields = CENTRAL_HEADER.unpack_from(directory, offset)
+        if fields[0] != CENTRAL_SIGNATURE:
+            raise zipfile.BadZipFile("Répertoire central corrompu")
+        name_start = offset + CENTRAL_HEADER.size
+        extra_start = name_start + fields[10]
+        comment_start = extra_start + fields[11]
+        offset = comment_start + fields[12]
+
+        name_bytes = directory[name_start:extra_start]
+        name = name_bytes.decode('utf-8' if fields[3] & FLAG_UTF8 else 'cp437')
+        entries.append(_ZipEntry(name, fields, name_bytes,
+                                 directory[extra_start:comment_start],
+                                 directory[comment_start:offset]))
+    return entries, comment
+
+
+def _local_record_size(f, entry):
+    """Taille totale (en-tête local, données et descripteur) d'un membre."""
+    f.seek(entry.local_offset)
+    header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+    if header[0] != LOCAL_SIGNATURE:
+        raise zipfile.BadZipFile(f"En-tête local invalide pour {entry.name}")
+    size = LOCAL_HEADER.size + header[9] + header[10] + entry.compressed_size
+
+    if entry.flags & FLAG_DATA_DESCRIPTOR:
+        f.seek(entry.local_offset + size)
+        size += 16 if f.read(4) == DESCRIPTOR_SIGNATURE else 12
+    return size
+
+
+def _copy_range(source, destination, offset, length):
+    source.seek(offset)
+    while length:
+        chunk = source.read(min(length, 1024 * 1024))
+        if not chunk:
+            raise zipfile.BadZipFile("Archive tronquée")
+        destination.write(chunk)
+        length -= len(chunk)
+
+
+def _write_member(destination, entry, content):
+    """Écrit un membre compressé et retourne son enregistrement du répertoire central."""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    compressed = compressor.compress(content) + compressor.flush()
+    crc = zlib.crc32(content)
+    flags = entry.flags & FLAG_UTF8
+    offset = destination.tell()
+
+    destination.write(LOCAL_HEADER.pack(
+        LOCAL_SIGNATURE, 20, flags, zipfile.ZIP_DEFLATED, entry.fields[5], entry.fields[6],
+        crc, len(compressed), len(content), len(entry.name_bytes), 0
+    ))
+    destination.write(entry.name_bytes)
+    destination.write(compressed)
+
+    return entry.central_record(version_needed=20, flags=flags, method=zipfile.ZIP_DEFLATED, crc=crc,
+                                compressed_size=len(compressed), size=len(content),
+                                local_offset=offset, extra=b'')
+
+
+def _rewrite_archive(filename, replacements, removed=()):
+    """Réécrit l'archive en remplaçant certains membres et en recopiant les autres tels quels."""
+    directory = os.path.dirname(os.path.abspath(filename))
+    descriptor, temporary = tempfile.mkstemp(suffix='.xlsx', dir=directory)
+    try:
+        with open(filename, 'rb') as source, os.fdopen(descriptor, 'wb') as destination:
+            entries, comment = _read_central_directory(source)
+            records = []
+            for entry in entries:
+                if entry.name in removed:
+                    continue
+                if entry.name in replacements:
+                    records.append(_write_member(destination, entry, replacements[entry.name]))
+                    continue
+
+                offset = destination.tell()
+                _copy_range(source, destination, entry.local_offset, _local_record_size(source, entry))
+                records.append(entry.central_record(local_offset=offset))
+
+            directory_offset = destination.tell()
+            for record in records:
+                destination.write(record)
+            directory_size = destination.tell() - directory_offset
+            destination.write(END_OF_CENTRAL_DIR.pack(
+                END_SIGNATURE, 0, 0, len(records), len(records),
+                directory_size, directory_offset, len(comment)
+            ))
+            destination.write(comment)
+
+        shutil.copymode(filename, temporary)
+        os.replace(temporary, filename)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def _sheet_member(archive, sheet_name):
+    """Retourne le chemin dans l'archive du XML de la feuille demandée."""
+    workbook = ET.fromstring(archive.read(WORKBOOK_XML))
+    relation_id = None
+    for sheet in workbook.iter(f"{{{MAIN_NS}}}sheet"):
+        if sheet.get('name') == sheet_name:
+            relation_id = sheet.get(f"{{{REL_NS}}}id")
+            break
+    if relation_id is None:
+        raise KeyError(f"Worksheet {sheet_name} does not exist.")
+
+    relations = ET.fromstring(archive.read(WORKBOOK_RELS))
+    for relation in relations.iter(f"{{{PACKAGE_REL_NS}}}Relationship"):
+        if relation.get('Id') == relation_id:
+            target = relation.get('Target')
+            if target.startswith('/'):
+                return target.lstrip('/')
+            return os.path.normpath(os.path.join('xl', target)).replace(os.sep, '/')
+    raise KeyError(f"Relation {relation_id} introuvable")
+
+
+def _uses_1904_dates(archive):
+    workbook = ET.fromstring(archive.read(WORKBOOK_XML))
+    properties = workbook.find(f"{{{MAIN_NS}}}workbookPr")
+    return properties is not None and properties.get('date1904') in ('1', 'true')
+
+
+def _excel_serial(value, date1904=False):
+    """Convertit une date en numéro de série Excel."""
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    origin = datetime(1904, 1, 1) if date1904 else datetime(1899, 12, 30)
+    delta = value - origin
+    serial = delta.days + delta.seconds / 86400
+    return int(serial) if serial == int(serial) else serial
+
+
+def _split_coordinate(coordinate):
+    match = re.fullmatch(r"([A-Z]+)(\d+)", coordinate)
+    column = 0
+    for letter in match.group(1):
+        column = column * 26 + ord(letter) - ord('A') + 1
+    return column, int(match.group(2))
+
+
+def _cell_xml(prefix, coordinate, value, style, date1904):
+    style_attribute = f' s="{style}"' if style else ''
+    if isinstance(value, (datetime, date)):
+        value = _excel_serial(value, date1904)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<{prefix}c r="{coordinate}"{style_attribute}><{prefix}v>{value}</{prefix}v></{prefix}c>'
+    # Chaîne en ligne : la table des chaînes partagées reste inchangée
+    text = escape('' if value is None else str(value))
+    return (f'<{prefix}c r="{coordinate}"{style_attribute} t="inlineStr"><{prefix}is>'
+            f'<{prefix}t xml:space="preserve">{text}</{prefix}t></{prefix}is></{prefix}c>')
+
+
+def _keep_cell_type(prefix, old_cell, value):
+    """Une cellule numérique reste numérique quand la nouvelle valeur est un nombre saisi en texte."""
+    if not isinstance(value, str) or not NUMBER_PATTERN.fullmatch(value.strip()):
+        return value
+    cell_type = re.match(r'[^>]*?\bt="(\w+)"', old_cell)
+    if (cell_type is None or cell_type.group(1) == 'n') and f'<{prefix}v>' in old_cell:
+        number = float(value)
+        return int(number) if number.is_integer() and '.' not in value else number
+    return value
+
+
+def _set_cell(sheet_xml, coordinate, value, date1904=False):
+    """Remplace ou insère une cellule dans le XML de la feuille.
+
+    Retourne le XML modifié et un booléen indiquant si une formule a été écrasée.
+    """
+    column, row = _split_coordinate(coordinate)
+    prefix = re.search(r"<(\w+:)?sheetData\b", sheet_xml).group(1) or ''
+
+    row_pattern = re.compile(
+        rf'<{prefix}row\b[^>]*?\br="{row}"[^>]*?(?:/>|>.*?</{prefix}row>)', re.DOTALL
+    )
+    cell_pattern = re.compile(
+        rf'<{prefix}c\b[^>]*?\br="(?P<ref>[A-Z]+\d+)"[^>]*?(?:/>|>.*?</{prefix}c>)', re.DOTALL
+    )
+
+    row_match = row_pattern.search(sheet_xml)
+    if row_match is None:
+        # Insérer une nouvelle ligne à sa place dans sheetData
+        new_row = f'<{prefix}row r="{row}">{_cell_xml(prefix, coordinate, value, None, date1904)}</{prefix}row>'
+        if re.search(rf'<{prefix}sheetData\s*/>', sheet_xml):
+            return re.sub(rf'<{prefix}sheetData\s*/>',
+                          lambda m: f'<{prefix}sheetData>{new_row}</{prefix}sheetData>',
+                          sheet_xml, count=1), False
+        for match in re.finditer(rf'<{prefix}row\b[^>]*?\br="(\d+)"', sheet_xml):
+            if int(match.group(1)) > row:
+                return sheet_xml[:match.start()] + new_row + sheet_xml[match.start():], False
+        position = sheet_xml.index(f'</{prefix}sheetData>')
+        return sheet_xml[:position] + new_row + sheet_xml[position:], False
+
+    row_xml = row_match.group(0)
+    if row_xml.endswith('/>'):
+        row_xml = row_xml[:-2] + f'></{prefix}row>'
+
+    had_formula = False
+    insert_at = row_xml.rindex(f'</{prefix}row>')
+    for cell_match in cell_pattern.finditer(row_xml):
+        cell_column, _ = _split_coordinate(cell_match.group('ref'))
+        if cell_column == column:
+            old_cell = cell_match.group(0)
+            if re.search(rf'<{prefix}f\b[^>]*\bt="shared"[^>]*\bref="', old_cell):
+                # Les cellules dépendantes ne portent que l'index de la formule partagée
+                raise ValueError(
+                    f"La cellule {coordinate} porte une formule partagée par d'autres cellules ; "
+                    f"elle ne peut pas être remplacée"
+                )
+            style = re.match(r'[^>]*?\bs="(\d+)"', old_cell)
+            had_formula = f'<{prefix}f' in old_cell
+            value = _keep_cell_type(prefix, old_cell, value)
+            new_cell = _cell_xml(prefix, coordinate, value, style and style.group(1), date1904)
+            row_xml = row_xml[:cell_match.start()] + new_cell + row_xml[cell_match.end():]
+            break
+        if cell_column > column:
+            insert_at = cell_match.start()
+            row_xml = row_xml[:insert_at] + _cell_xml(prefix, coordinate, value, None, date1904) + row_xml[insert_at:]
+            break
+    else:
+        row_xml = row_xml[:insert_at] + _cell_xml(prefix, coordinate, value, None, date1904) + row_xml[insert_at:]
+
+    return sheet_xml[:row_match.start()] + row_xml + sheet_xml[row_match.end():], had_formula
+
+
+def _without_calc_chain(archive):
+    """Retire les références à la chaîne de calcul, reconstruite par Excel à l'ouverture."""
+    replacements = {}
+    content_types = archive.read(CONTENT_TYPES).decode('utf-8')
+    replacements[CONTENT_TYPES] = re.sub(
+        r'<Override\b[^>]*PartName="/xl/calcChain\.xml"[^>]*/>', '', content_types
+    ).encode('utf-8')
+    relations = archive.read(WORKBOOK_RELS).decode('utf-8')
+    replacements[WORKBOOK_RELS] = re.sub(
+        r'<Relationship\b[^>]*Target="[^"]*calcChain\.xml"[^>]*/>', '', relations
+    ).encode('utf-8')
+    return replacements
+
+
+def write_cells(filename, sheet_name, values):
+    """Écrit les valeurs {coordonnée: valeur} dans une feuille du classeur, sur place."""
+    with zipfile.ZipFile(filename) as archive:
+        member = _sheet_member(archive, sheet_name)
+        date1904 = _uses_1904_dates(archive)
+        sheet_xml = archive.read(member).decode('utf-8')
+        has_calc_chain = CALC_CHAIN in archive.namelist()
+
+        formula_overwritten = False
+        for coordinate, value in values.items():
+            sheet_xml, had_formula = _set_cell(sheet_xml, coordinate, value, date1904)
+            formula_overwritten = formula_overwritten or had_formula
+
+        replacements = {member: sheet_xml.encode('utf-8')}
+        removed = ()
+        if formula_overwritten and has_calc_chain:
+            replacements.update(_without_calc_chain(archive))
+            removed = (CALC_CHAIN,)
+
+    _rewrite_archive(filename, replacements, removed)
+
+
+def stamp_workbook(filename, bordereau_id, sending_date, status, info_cells=None):
+    """Reporte le numéro de bordereau, la date et le statut dans la page de garde."""
+    info_cells = info_cells or InformationExcelCells()
+    write_cells(filename, info_cells.INFO_WORKSHEET, {
+        info_cells.DATE: sending_date,
+        info_cells.ID: bordereau_id,
+        info_cells.STATUS: status,
+    })
@@ -0,0 +1,257 @@
+"""Envoi des bordereaux par mail.
+
+Les messages d'un même lot passent par une file bornée et sont envoyés sur
+une seule connexion SMTP, réutilisée d'un message à l'autre. Les erreurs
+temporaires sont retentées avec un délai croissant ; les messages qui
+échouent malgré tout sont conservés dans la boîte d'envoi pour être renvoyés
+plus tard : chaque nouvel envoi commence par les renvoyer.
+"""
+import json
+import os
+import queue
+import smtplib
+import threading
+import time
+import unicodedata
+import uuid
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+
+FICHIER_CONFIG = "smtp.json"
+DOSSIER_OUTBOX = "outbox"
+
+# Un seul envoi à la fois relit la boîte d'envoi : un message n'est pas renvoyé deux fois
+_OUTBOX_LOCK = threading.Lock()
+
+DEFAULT_CONFIG = {
+    "host": "localhost",
+    "port": 25,
+    "username": None,
+    "password": None,
+    "use_tls": False,
+    "sender": "bordereaux@omexom.com",
+    "timeout": 30
+}
+
+
+def load_config(path=FICHIER_CONFIG):
+    """Charge la configuration SMTP, complétée par les valeurs par défaut.
+
+    Lève ValueError si le fichier n'est pas un JSON valide ou contient une clé inconnue.
+    """
+    config = dict(DEFAULT_CONFIG)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            values = json.load(f)
+        unknown = sorted(set(values) - set(DEFAULT_CONFIG))
+        if unknown:
+            raise ValueError(f"Clé(s) inconnue(s) dans {path} : {', '.join(unknown)}")
+        config.update(values)
+    return config
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).upper().split())
+
+
+def find_recipient_email(data, company, receiver):
+    """Recherche l'email du destinataire dans le carnet d'adresses."""
+    company = _normalize(company)
+    receiver = _normalize(receiver)
+    for entreprise in data.get("entreprises", []):
+        if _normalize(entreprise["nom"]) != company:
+            continue
+        for employee in entreprise["personnel"]:
+            names = (
+                _normalize(f'{employee["prenom"]} {employee["nom"]}'),
+                _normalize(f'{employee["nom"]} {employee["prenom"]}')
+            )
+            if receiver in names:
+                return employee.get("email")
+    return None
+
+
+def build_message(form_data, recipient, pdf_path, sender):
+    """Construit le mail d'un bordereau avec le PDF en pièce jointe."""
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = recipient
+    message["Subject"] = f"Bordereau d'envoi {form_data['id']} - {form_data['title']}"
+    message.set_content(
+        f"Bonjour {form_data['receiver']},\n\n"
+        f"Veuillez trouver ci-joint le bordereau d'envoi {form_data['id']} "
+        f"({form_data['status_text']}).\n\n"
+        f"{form_data['message']}\n\n"
+        f"{form_data['sender']}"
+    )
+    with open(pdf_path, "rb") as f:
+        message.add_attachment(
+            f.read(),
+            maintype="application",
+            subtype="pdf",
+            filename=f"{form_data['id']}.pdf"
+        )
+    return message
+
+
+class MailSender:
+    """Envoie des messages par lot sur une connexion SMTP unique."""
+
+    _STOP = object()
+
+    def __init__(self, host, port=25, username=None, password=None, use_tls=False,
+                 sender=None, timeout=30, queue_size=50, max_retries=3, backoff=1.0,
+                 outbox=DOSSIER_OUTBOX):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.sender = sender
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.outbox = outbox
+        self.sent = 0
+        self.failed = []
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._connection = None
+        self._worker = None
+
+    def __enter__(self):
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, message, outbox_path=None):
+        """Ajoute un message à la file (bloque tant que la file est pleine)."""
+        self._queue.put((message, outbox_path))
+
+    def close(self):
+        """Attend la fin des envois en cours puis ferme la connexion."""
+        if self._worker is not None:
+            self._queue.put(self._STOP)
+            self._worker.join()
+            self._worker = None
+        self._disconnect()
+
+    def flush_outbox(self):
+        """Remet dans la file les messages restés dans la boîte d'envoi."""
+        if not os.path.isdir(self.outbox):
+            return 0
+        count = 0
+        for filename in sorted(os.listdir(self.outbox)):
+            if not filename.endswith(".eml"):
+                continue
+            path = os.path.join(self.outbox, filename)
+            try:
+                with open(path, "rb") as f:
+                    message = BytesParser(policy=policy.default).parse(f)
+            except OSError:
+                continue
+            self.submit(message, outbox_path=path)
+            count += 1
+        return count
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            message, outbox_path = item
+            try:
+                delivered = self._deliver(message)
+            except Exception:
+                self._disconnect()
+                delivered = False
+
+            # Une erreur disque ne doit pas arrêter le thread : close() attendrait indéfiniment
+            if delivered:
+                self.sent += 1
+                if outbox_path and os.path.exists(outbox_path):
+                    try:
+                        os.remove(outbox_path)
+                    except OSError:
+                        pass
+            else:
+                self.failed.append(message)
+                if not outbox_path:
+                    try:
+                        self._save_to_outbox(message)
+                    except OSError:
+                        pass
+
+    def _connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        self._connection = connection
+
+    def _disconnect(self):
+        if self._connection is None:
+            return
+        try:
+            self._connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self._connection.close()
+        self._connection = None
+
+    def _deliver(self, message):
+        """Envoie un message, en retentant les erreurs temporaires."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self._connection is None:
+                    self._connect()
+                self._connection.send_message(message, from_addr=self.sender)
+                return True
+            except smtplib.SMTPResponseException as e:
+                # Les codes 5xx sont définitifs, inutile de réessayer
+                if e.smtp_code >= 500:
+                    self._reset()
+                    return False
+                self._disconnect()
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError):
+                self._disconnect()
+            except smtplib.SMTPException:
+                self._reset()
+                return False
+
+            if attempt < self.max_retries:
+                time.sleep(self.backoff * 2 ** attempt)
+        return False
+
+    def _reset(self):
+        """Remet la session à zéro après un refus pour envoyer le message suivant."""
+        try:
+            self._connection.rset()
+        except (smtplib.SMTPException, OSError, AttributeError):
+            self._disconnect()
+
+    def _save_to_outbox(self, message):
+        os.makedirs(self.outbox, exist_ok=True)
+        path = os.path.join(self.outbox, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.eml")
+        with open(path, "wb") as f:
+            f.write(message.as_bytes(policy=policy.SMTP))
+        return path
+
+
+def send_messages(messages, config=None, flush=True, **options):
+    """Envoie une liste de messages sur une seule connexion et retourne l'expéditeur utilisé.
+
+    Avec flush, les messages restés dans la boîte d'envoi partent d'abord sur la même connexion.
+    """
+    config = config or load_config()
+    with _OUTBOX_LOCK:
+        with MailSender(**config, **options) as mail_sender:
+            if flush:
+                mail_sender.flush_outbox()
+            for message in messages:
+                mail_sender.submit(message)
+    return mail_sender
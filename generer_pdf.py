@@ -1,9 +1,37 @@
+import csv
+import hashlib
+import json
 import locale
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from fpdf import FPDF
 
 # Constants
 LOCALE_SETTINGS = 'fr_FR.UTF-8'
+MANIFEST_EXTENSION = '.json'
+FILES_LIST_EXTENSION = '.csv'
+# Champs du bordereau repris dans le manifeste ; le chemin du classeur n'en fait pas partie
+MANIFEST_FIELDS = ('rank', 'project', 'number', 'date', 'id', 'title', 'sender', 'receiver',
+                   'company', 'files_quantity', 'message', 'status', 'status_text', 'response_delay')
+# Caractères interdits dans un nom de fichier Windows
+INVALID_FILENAME_CHARS = r'[<>:"/\\|?*\x00-\x1f]'
+RESERVED_FILENAMES = r'(?i)^(CON|PRN|AUX|NUL|COM\d|LPT\d)$'
+
+# Polices TrueType du tableau des fichiers : les polices de base du PDF ne couvrent que le latin-1,
+# alors que les classeurs contiennent apostrophes typographiques, tirets longs, symbole euro...
+WINDOWS_FONTS_DIR = os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts')
+UNICODE_FONTS = [
+    (os.path.join(WINDOWS_FONTS_DIR, 'arial.ttf'), os.path.join(WINDOWS_FONTS_DIR, 'arialbd.ttf')),
+    ('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'),
+]
+TABLE_FONT = 'tableau'
+# Équivalents latin-1 utilisés quand aucune police Unicode n'est installée
+LATIN1_REPLACEMENTS = str.maketrans({
+    '\u2018': "'", '\u2019': "'", '\u201c': '"', '\u201d': '"',
+    '\u2013': '-', '\u2014': '-', '\u2026': '...', '\u20ac': 'EUR', '\u0153': 'oe', '\u0152': 'OE'
+})
 
 # Colors
 BLUE_COLOR = (43, 113, 184)
@@ -41,6 +69,7 @@ class PDFDocument(FPDF):
 class DispatchDocument:
     def __init__(self, form_data):
         self.form_data = form_data
+        self.sha256 = None
 
     @contextmanager
     def _pdf_context(self):
@@ -82,11 +111,178 @@ class DispatchDocument:
         pdf.cell(40, 10, f"Statut : {self.form_data['status']}")
         pdf.ln(10)
         pdf.cell(40, 10, f"Transmission : {self.form_data['transmission_modes']}")
+        pdf.ln(10)
+        self._add_files_table(pdf)
         return pdf
 
-    def generate_pdf(self):
+    def _add_files_table(self, pdf):
+        """Ajoute le tableau des lignes de la feuille 'Fichiers', sur plusieurs pages si besoin."""
+        files = self.form_data.get('files')
+        if not files:
+            return
+
+        header = self.form_data.get('files_header') or []
+        column_count = max(len(header), max(len(row) for row in files))
+        column_width = pdf.epw / column_count
+        family, bold_style, text = self._table_font(pdf)
+
+        pdf.ln(5)
+        pdf.set_font(family, style=bold_style, size=10)
+        pdf.set_fill_color(*GRAY_BACKGROUND)
+        for i in range(column_count):
+            pdf.cell(column_width, 7, text(header[i]) if i < len(header) else "", border=1, fill=True)
+        pdf.ln(7)
+
+        pdf.set_font(family, size=9)
+        for row in files:
+            for i in range(column_count):
+                pdf.cell(column_width, 6, text(row[i]) if i < len(row) else "", border=1)
+            pdf.ln(6)
+
+    @staticmethod
+    def _table_font(pdf):
+        """Enregistre la première police Unicode disponible.
+
+        Retourne (famille, style de l'en-tête, conversion du texte). Sans police
+        Unicode, le texte est ramené au latin-1 de la police helvetica.
+        """
+        for regular, bold in UNICODE_FONTS:
+            if os.path.exists(regular):
+                pdf.add_font(TABLE_FONT, '', regular)
+                if bold and os.path.exists(bold):
+                    pdf.add_font(TABLE_FONT, 'B', bold)
+                    return TABLE_FONT, 'B', str
+                return TABLE_FONT, '', str
+
+        def latin1(value):
+            return value.translate(LATIN1_REPLACEMENTS).encode('latin-1', 'replace').decode('latin-1')
+        return 'helvetica', 'B', latin1
+
+    def generate_pdf(self, output_path='test.pdf', sidecars=False, executor=None):
+        """Génère le PDF et, si demandé, le manifeste JSON et la liste CSV des fichiers.
+
+        Les fichiers annexes sont construits à partir des mêmes données, sans relire le
+        classeur. Avec un executor, leur écriture lui est confiée et les futures sont
+        retournées ; sinon ils sont écrits immédiatement.
+        """
         with self._pdf_context() as pdf:
-            pdf.output('test.pdf')
+            content = bytes(pdf.output())
+
+        with open(output_path, 'wb') as f:
+            f.write(content)
+        self.sha256 = hashlib.sha256(content).hexdigest()
+
+        if not sidecars:
+            return []
+
+        base_path = os.path.splitext(output_path)[0]
+        manifest = self.build_manifest(output_path, len(content))
+        writes = [
+            (write_manifest, base_path + MANIFEST_EXTENSION, manifest),
+            (write_files_list, base_path + FILES_LIST_EXTENSION, self.form_data),
+        ]
+        if executor is None:
+            for write, path, data in writes:
+                write(path, data)
+            return []
+        return [executor.submit(write, path, data) for write, path, data in writes]
+
+    def build_manifest(self, pdf_path, pdf_size):
+        """Données lisibles par machine accompagnant le PDF."""
+        header = self.form_data.get('files_header') or []
+        files = [
+            {header[i] if i < len(header) and header[i] else f"colonne_{i + 1}": value
+             for i, value in enumerate(row)}
+            for row in self.form_data.get('files') or []
+        ]
+        return {
+            'bordereau': {key: self.form_data[key] for key in MANIFEST_FIELDS if key in self.form_data},
+            'classeur': os.path.basename(self.form_data.get('excel_file') or ''),
+            'transmission_modes': self.form_data.get('transmission_modes', {}),
+            'fichiers': files,
+            'pdf': {
+                'fichier': os.path.basename(pdf_path),
+                'taille': pdf_size,
+                'sha256': self.sha256
+            }
+        }
+
+
+def write_manifest(path, manifest):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False, default=str)
+
+
+def write_files_list(path, form_data):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        if form_data.get('files_header'):
+            writer.writerow(form_data['files_header'])
+        writer.writerows(form_data.get('files') or [])
+
+
+def safe_filename(name, default='bordereau'):
+    """Nom de fichier utilisable sous Windows comme sous Linux à partir d'un identifiant de bordereau."""
+    name = re.sub(INVALID_FILENAME_CHARS, '_', str(name)).strip().rstrip('. ')
+    if re.match(RESERVED_FILENAMES, name):
+        name += '_'
+    return name or default
+
+
+def _remove_outputs(pdf_path):
+    """Supprime le PDF et ses fichiers annexes déjà écrits."""
+    base_path = os.path.splitext(pdf_path)[0]
+    for path in (pdf_path, base_path + MANIFEST_EXTENSION, base_path + FILES_LIST_EXTENSION):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def generate_batch(documents_data, output_dir, sidecars=True):
+    """Génère une série de bordereaux ; les fichiers annexes sont écrits sur un thread d'E/S.
+
+    documents_data contient les form_data déjà extraits : aucun classeur n'est relu.
+    Deux bordereaux de même identifiant sont distingués par un suffixe (-2, -3...).
+    Un document en erreur n'interrompt pas le lot et ses fichiers partiels sont supprimés.
+    Retourne un résultat par document, dans l'ordre : {'id', 'pdf', 'error'}, avec
+    'pdf' à None et le message dans 'error' en cas d'échec.
+    """
+    results = []
+    pending = []
+    used_names = set()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='sidecars') as executor:
+        for form_data in documents_data:
+            base_name = safe_filename(form_data['id'])
+            name, suffix = base_name, 1
+            # Comparaison insensible à la casse, comme le système de fichiers Windows
+            while name.lower() in used_names:
+                suffix += 1
+                name = f"{base_name}-{suffix}"
+            used_names.add(name.lower())
+            output_path = os.path.join(output_dir, f"{name}.pdf")
+
+            result = {'id': form_data['id'], 'pdf': output_path, 'error': None}
+            results.append(result)
+            try:
+                futures = DispatchDocument(form_data).generate_pdf(output_path, sidecars, executor)
+            except Exception as e:
+                result['pdf'], result['error'] = None, str(e)
+                _remove_outputs(output_path)
+                continue
+            pending.append((result, futures))
+
+    # Remonter les erreurs d'écriture des fichiers annexes
+    for result, futures in pending:
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                result['error'] = result['error'] or str(e)
+        if result['error']:
+            _remove_outputs(result['pdf'])
+            result['pdf'] = None
+    return results
 
 if __name__ == "__main__":
     locale.setlocale(locale.LC_TIME, LOCALE_SETTINGS)
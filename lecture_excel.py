@@ -0,0 +1,220 @@
+from dataclasses import dataclass
+import re
+import openpyxl
+from openpyxl.utils import get_column_letter
+
+
+@dataclass
+class InformationExcelCells:
+    INFO_WORKSHEET: str = 'Page de garde'
+    PROJECT: str = 'B3'
+    SENDING_INFO: str = 'C8'
+    DATE: str = 'C5'
+    ID: str = 'C7'
+    SENDER: str = 'C6'
+    MESSAGE: str = 'C11'
+    FILES_QUANTITY: str = 'C9'
+    STATUS: str = 'C10'
+
+
+@dataclass
+class filesExcelCells:
+    FILES_WORKSHEET: str = 'Fichiers'
+
+
+class ExcelDocument:
+    XLSX_EXTENSION = '.xlsx'
+    STATUS = {
+        "BPE": "Bon pour exécution",
+        "BPO": "Bon pour observation",
+        "APPRO": "Pour approbation",
+        "INF": "Pour information",
+        "V1": "Dossier V1",
+        "V2": "Dossier V2",
+        "CAE": "Conforme à exécution"
+    }
+    PROJECT_PATTERN = r"^NANCY-(?P<rank>[^-]+)-(?P<project>[^-]+)-(?P<number>[^-]+)$"
+    SENDING_INFO_PATTERN = r"@(?P<receiver>.+?)\s+\((?P<company>.+?)\)\s+#(?P<title>.+)"
+    # Champs obligatoires du formulaire (excluant title et message)
+    REQUIRED_FIELDS = ['rank', 'project', 'number', 'date', 'id',
+                       'sender', 'receiver', 'company', 'files_quantity']
+    # Cellule de la page de garde (attribut de InformationExcelCells) d'où provient chaque champ
+    FIELD_CELLS = {
+        'rank': 'PROJECT',
+        'project': 'PROJECT',
+        'number': 'PROJECT',
+        'receiver': 'SENDING_INFO',
+        'company': 'SENDING_INFO',
+        'title': 'SENDING_INFO',
+        'date': 'DATE',
+        'id': 'ID',
+        'sender': 'SENDER',
+        'files_quantity': 'FILES_QUANTITY',
+        'message': 'MESSAGE'
+    }
+    # Format attendu des cellules dont plusieurs champs sont extraits
+    CELL_FORMATS = {
+        'PROJECT': "NANCY-classement-projet-affaire",
+        'SENDING_INFO': "@destinataire (entreprise) #titre"
+    }
+
+
+def _read_info_cells(sheet, cells):
+    """Lit en une seule passe les cellules de la page de garde."""
+    # Valeurs brutes indexées par cellule : 'project' pour PROJECT, 'sending_info' pour SENDING_INFO...
+    wanted = {cell.lower(): getattr(cells, cell) for cell in set(ExcelDocument.FIELD_CELLS.values())}
+    max_row = max(int(re.sub(r'\D', '', coordinate)) for coordinate in wanted.values())
+
+    # En mode lecture seule, sheet['C5'] reparcourt la feuille à chaque accès
+    values = {}
+    for row_index, row in enumerate(sheet.iter_rows(max_row=max_row, values_only=True), start=1):
+        for column_index, value in enumerate(row, start=1):
+            values[f"{get_column_letter(column_index)}{row_index}"] = value
+
+    return {key: values.get(coordinate) for key, coordinate in wanted.items()}
+
+
+def _read_files_rows(sheet):
+    """Lit la feuille des fichiers ligne par ligne, sans la charger en entier."""
+    rows = sheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return [], []
+
+    header = ['' if value is None else str(value) for value in header]
+    files = []
+    for row in rows:
+        if all(value is None or value == '' for value in row):
+            continue
+        files.append(['' if value is None else str(value) for value in row])
+    return header, files
+
+
+def format_date(value):
+    """Texte affiché dans le formulaire et le PDF pour la date de la page de garde."""
+    # Convertir en chaîne et supprimer les 5 derniers caractères
+    return str(value)[:-6] if value else ''
+
+
+def read_workbook(filename, info_cells=None, files_cells=None, with_files=True):
+    """Extrait les données de la page de garde et de la feuille des fichiers.
+
+    Retourne un dictionnaire contenant les valeurs brutes des cellules
+    ('raw'), les champs du formulaire déduits de ces valeurs et les lignes
+    de la feuille 'Fichiers' (None si la feuille est absente ou si
+    with_files est faux).
+    """
+    info_cells = info_cells or InformationExcelCells()
+    files_cells = files_cells or filesExcelCells()
+
+    workbook = openpyxl.load_workbook(filename, read_only=True)
+    try:
+        raw = _read_info_cells(workbook[info_cells.INFO_WORKSHEET], info_cells)
+        has_files_sheet = files_cells.FILES_WORKSHEET in workbook.sheetnames
+    finally:
+        workbook.close()
+
+    files_header, files = None, None
+    if has_files_sheet and with_files:
+        # Les lignes partent dans le PDF, le manifeste et la GED : il faut les valeurs calculées, pas les formules
+        values_workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+        try:
+            files_header, files = _read_files_rows(values_workbook[files_cells.FILES_WORKSHEET])
+        finally:
+            values_workbook.close()
+
+    data = {
+        'raw': raw,
+        'rank': '',
+        'project': '',
+        'number': '',
+        'receiver': '',
+        'company': '',
+        'title': '',
+        'has_files_sheet': has_files_sheet,
+        'files_header': files_header,
+        'files': files,
+    }
+
+    # Récupérer les données du projet
+    if raw['project']:
+        match = re.match(ExcelDocument.PROJECT_PATTERN, str(raw['project']))
+        if match:
+            data.update(match.groupdict())
+
+    # Récupérer les informations d'envoi
+    if raw['sending_info']:
+        match = re.match(ExcelDocument.SENDING_INFO_PATTERN, str(raw['sending_info']))
+        if match:
+            data.update(match.groupdict())
+
+    data['date'] = format_date(raw['date'])
+    data['id'] = raw['id'] or ''
+    data['sender'] = raw['sender'] or ''
+    data['files_quantity'] = raw['files_quantity'] or ''
+    data['message'] = raw['message'] or ''
+
+    return data
+
+
+def validate_workbook_data(data, info_cells=None, files_cells=None):
+    """Retourne la liste des anomalies relevées dans les données extraites d'un classeur."""
+    info_cells = info_cells or InformationExcelCells()
+    files_cells = files_cells or filesExcelCells()
+    raw = data['raw']
+    errors = []
+
+    # Une anomalie par cellule, même si plusieurs champs en sont extraits
+    reported = set()
+    for field in ExcelDocument.REQUIRED_FIELDS:
+        cell = ExcelDocument.FIELD_CELLS[field]
+        if data[field] or cell in reported:
+            continue
+        reported.add(cell)
+        coordinate = getattr(info_cells, cell)
+        if cell in ExcelDocument.CELL_FORMATS:
+            value = raw[cell.lower()] or ''
+            errors.append(f"{coordinate} : '{value}' ne correspond pas au format {ExcelDocument.CELL_FORMATS[cell]}")
+        else:
+            errors.append(f"{coordinate} : champ '{field}' manquant")
+
+    if not data['has_files_sheet']:
+        errors.append(f"Feuille '{files_cells.FILES_WORKSHEET}' absente")
+
+    return errors
+
+
+def build_form_data(fields, status, response_delay='', transmission_modes=None, excel_file=''):
+    """Assemble les données d'un bordereau telles que les attend DispatchDocument.
+
+    fields fournit les champs du formulaire et les lignes de la feuille
+    'Fichiers' : valeurs saisies dans la fenêtre, ou dictionnaire retourné
+    par read_workbook pour une génération par lot.
+    """
+    return {
+        'excel_file': excel_file,
+        # Informations du document
+        'rank': fields['rank'],
+        'project': fields['project'],
+        'number': fields['number'],
+        'date': fields['date'],
+        'id': fields['id'],
+        'title': fields['title'],
+        'sender': fields['sender'],
+        'receiver': fields['receiver'],
+        'company': fields['company'],
+        'files_quantity': fields['files_quantity'],
+        'message': fields['message'],
+
+        # Type de diffusion
+        'status': status,
+        'status_text': ExcelDocument.STATUS[status],  # Texte complet du statut
+        'response_delay': response_delay,
+
+        # Modes de transmission
+        'transmission_modes': transmission_modes or {'mail': False, 'transfer': False, 'courrier': False, 'acc': False},
+
+        # Lignes de la feuille 'Fichiers'
+        'files_header': fields.get('files_header'),
+        'files': fields.get('files')
+    }
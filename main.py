@@ -1,44 +1,14 @@
-from dataclasses import dataclass
 import ttkbootstrap as ttk
-from contacts import ContactsApp
+from contacts import ContactsApp, load_data
 from tkinter import filedialog
 from ttkbootstrap.dialogs import Messagebox
-import openpyxl
-import re
 import locale
+import threading
+from datetime import date, datetime, time
 from generer_pdf import DispatchDocument
-
-
-@dataclass
-class InformationExcelCells:
-    INFO_WORKSHEET: str = 'Page de garde'
-    PROJECT: str = 'B3'
-    SENDING_INFO: str = 'C8'
-    DATE: str = 'C5'
-    ID: str = 'C7'
-    SENDER: str = 'C6'
-    MESSAGE: str = 'C11'
-    FILES_QUANTITY: str = 'C9'
-
-
-@dataclass
-class filesExcelCells:
-    FILES_WORKSHEET: str = 'Fichiers'
-
-
-class ExcelDocument:
-    XLSX_EXTENSION = '.xlsx'
-    STATUS = {
-        "BPE": "Bon pour exécution",
-        "BPO": "Bon pour observation",
-        "APPRO": "Pour approbation",
-        "INF": "Pour information",
-        "V1": "Dossier V1",
-        "V2": "Dossier V2",
-        "CAE": "Conforme à exécution"
-    }
-    PROJECT_PATTERN = r"^NANCY-(?P<rank>[^-]+)-(?P<project>[^-]+)-(?P<number>[^-]+)$"
-    SENDING_INFO_PATTERN = r"@(?P<receiver>.+?)\s+\((?P<company>.+?)\)\s+#(?P<title>.+)"
+from lecture_excel import InformationExcelCells, filesExcelCells, ExcelDocument, read_workbook, build_form_data, format_date
+from ecriture_excel import stamp_workbook
+from envoi_mail import load_config, find_recipient_email, build_message, send_messages
 
 
 class dispatchApp:
@@ -50,6 +20,8 @@ class dispatchApp:
         self.root.resizable(False, False)
         self.info_excel_cells = InformationExcelCells()
         self.files_excel_cells = filesExcelCells()
+        self.files_header = None
+        self.files = None
         self.setup_ui()
 
     def create_menu(self):
@@ -57,6 +29,7 @@ class dispatchApp:
         # Menu "Fichier"
         file_menu = ttk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Gestion du carnet d'adresse", command=self.open_contacts_app)
+        file_menu.add_command(label="Renvoyer la boîte d'envoi", command=self.resend_outbox)
         file_menu.add_separator()
         file_menu.add_command(label="Quitter", command=self.root.quit)
         menubar.add_cascade(label="Fichier", menu=file_menu)
@@ -271,6 +244,14 @@ class dispatchApp:
         )
         self.generate_button.pack(side="right")
 
+        # Manifeste JSON et liste CSV des fichiers à côté du PDF
+        self.sidecars_var = ttk.BooleanVar()
+        ttk.Checkbutton(
+            button_container,
+            text="Générer le manifeste (JSON, CSV)",
+            variable=self.sidecars_var
+        ).pack(side="left")
+
         # Traces pour la validation
         self.search_var.trace_add('write', self.validate_form)
         for var_name in self.form_vars:
@@ -290,50 +271,24 @@ class dispatchApp:
 
     def load_excel_data(self, filename):
         try:
-            workbook = openpyxl.load_workbook(filename)
-
-            # Charger les données de la page de garde
-            info_sheet = workbook[self.info_excel_cells.INFO_WORKSHEET]
-
-            # Récupérer les données du projet
-            project_value = info_sheet[self.info_excel_cells.PROJECT].value
-            if project_value:
-                match = re.match(ExcelDocument.PROJECT_PATTERN, str(project_value))
-                if match:
-                    result = match.groupdict()
-                    self.form_vars['rank'].set(result['rank'])
-                    self.form_vars['project'].set(result['project'])
-                    self.form_vars['number'].set(result['number'])
-
-            # Récupérer les informations d'envoi
-            sending_info = info_sheet[self.info_excel_cells.SENDING_INFO].value
-            if sending_info:
-                match = re.match(ExcelDocument.SENDING_INFO_PATTERN, str(sending_info))
-                if match:
-                    result = match.groupdict()
-                    self.form_vars['receiver'].set(result['receiver'])
-                    self.form_vars['company'].set(result['company'])
-                    self.form_vars['title'].set(result['title'])
+            data = read_workbook(filename, self.info_excel_cells, self.files_excel_cells)
+            self.files_header = data['files_header']
+            self.files = data['files']
 
-            # Charger les autres champs
-            date_value = info_sheet[self.info_excel_cells.DATE].value
-            if date_value:
-                # Convertir en chaîne et supprimer les 5 derniers caractères
-                date_str = str(date_value)[:-6]
-                self.form_vars['date'].set(date_str)
-            else:
-                self.form_vars['date'].set('')
+            # Récupérer les données du projet et les informations d'envoi
+            for key in ('rank', 'project', 'number', 'receiver', 'company', 'title'):
+                if data[key]:
+                    self.form_vars[key].set(data[key])
 
-            self.form_vars['id'].set(info_sheet[self.info_excel_cells.ID].value or '')
-            self.form_vars['sender'].set(info_sheet[self.info_excel_cells.SENDER].value or '')
-            self.form_vars['files_quantity'].set(info_sheet[self.info_excel_cells.FILES_QUANTITY].value or '')
+            # Charger les autres champs
+            self.form_vars['date'].set(data['date'])
+            self.form_vars['id'].set(data['id'])
+            self.form_vars['sender'].set(data['sender'])
+            self.form_vars['files_quantity'].set(data['files_quantity'])
 
             # Pour le champ message qui est un widget Text
-            message_value = info_sheet[self.info_excel_cells.MESSAGE].value or ''
             self.message_widget.delete('1.0', 'end')
-            self.message_widget.insert('1.0', message_value)
-
-            workbook.close()
+            self.message_widget.insert('1.0', data['message'])
 
         except Exception as e:
             message = f"Erreur lors du chargement du fichier Excel : {str(e)}"
@@ -348,12 +303,8 @@ class dispatchApp:
             self.generate_button.configure(state="disabled")
             return
 
-        # Liste des champs obligatoires (excluant title et message)
-        required_fields = ['rank', 'project', 'number', 'date', 'id',
-                           'sender', 'receiver', 'company', 'files_quantity']
-
         # Vérifier les champs obligatoires
-        for field in required_fields:
+        for field in ExcelDocument.REQUIRED_FIELDS:
             if not self.form_vars[field].get():
                 self.generate_button.configure(state="disabled")
                 return
@@ -387,40 +338,112 @@ class dispatchApp:
         # Récupérer le message depuis le widget Text
         message = self.message_widget.get("1.0", "end-1c")
 
+        # La date d'envoi reportée dans la page de garde est aussi celle imprimée sur le PDF
+        sending_date = datetime.combine(date.today(), time())
+        self.form_vars['date'].set(format_date(sending_date))
+
         # Créer un dictionnaire avec toutes les données
-        form_data = {
-            'excel_file': self.search_var.get(),
-            # Informations du document
-            'rank': self.form_vars['rank'].get(),
-            'project': self.form_vars['project'].get(),
-            'number': self.form_vars['number'].get(),
-            'date': self.form_vars['date'].get(),
-            'id': self.form_vars['id'].get(),
-            'title': self.form_vars['title'].get(),
-            'sender': self.form_vars['sender'].get(),
-            'receiver': self.form_vars['receiver'].get(),
-            'company': self.form_vars['company'].get(),
-            'files_quantity': self.form_vars['files_quantity'].get(),
-            'message': message,
-
-            # Type de diffusion
-            'status': self.form_vars['status'].get(),
-            'status_text': ExcelDocument.STATUS[self.form_vars['status'].get()],  # Texte complet du statut
-            'response_delay': self.form_vars['response_delay'].get(),
-
-            # Modes de transmission
-            'transmission_modes': {
+        fields = {name: self.form_vars[name].get() for name in
+                  ('rank', 'project', 'number', 'date', 'id', 'title', 'sender', 'receiver', 'company', 'files_quantity')}
+        fields.update(message=message, files_header=self.files_header, files=self.files)
+        form_data = build_form_data(
+            fields,
+            self.form_vars['status'].get(),
+            response_delay=self.form_vars['response_delay'].get(),
+            transmission_modes={
                 'mail': self.form_vars['mail'].get(),
                 'transfer': self.form_vars['transfer'].get(),
                 'courrier': self.form_vars['courrier'].get(),
                 'acc': self.form_vars['acc'].get()
-            }
-        }
+            },
+            excel_file=self.search_var.get()
+        )
 
         # Créer l'instance de DispatchDocument avec les données
         document = DispatchDocument(form_data)
-        document.generate_pdf()
+        pdf_path = 'test.pdf'
+        try:
+            document.generate_pdf(pdf_path, sidecars=self.sidecars_var.get())
+        except Exception as e:
+            # Sans PDF, ni la page de garde ni le mail ne doivent être traités
+            ttk.Messagebox.show_error(
+                title="Erreur",
+                message=f"Erreur lors de la génération du PDF : {str(e)}"
+            )
+            return
 
+        # Reporter le numéro, la date et le statut dans la page de garde
+        try:
+            stamp_workbook(
+                form_data['excel_file'],
+                form_data['id'],
+                sending_date,
+                form_data['status_text'],
+                self.info_excel_cells
+            )
+        except Exception as e:
+            message = f"Erreur lors de la mise à jour du fichier Excel : {str(e)}"
+            ttk.Messagebox.show_error(
+                title="Erreur",
+                message=message
+            )
+
+        if form_data['transmission_modes']['mail']:
+            self.send_mail(form_data, pdf_path)
+
+    def send_mail(self, form_data, pdf_path):
+        # La connexion et les nouvelles tentatives peuvent durer : l'envoi ne doit pas figer la fenêtre
+        threading.Thread(target=self._send_mail_worker, args=(form_data, pdf_path), daemon=True).start()
+
+    def _send_mail_worker(self, form_data, pdf_path):
+        try:
+            error = self._deliver_mail(form_data, pdf_path)
+        except Exception as e:
+            error = f"Erreur lors de l'envoi du mail : {str(e)}"
+
+        # Les fenêtres ne peuvent être ouvertes que depuis le thread de l'interface
+        if error:
+            self.root.after(0, lambda: ttk.Messagebox.show_error(title="Erreur", message=error))
+
+    def resend_outbox(self):
+        threading.Thread(target=self._resend_outbox_worker, daemon=True).start()
+
+    def _resend_outbox_worker(self):
+        try:
+            mail_sender = send_messages([])
+            message = f"{mail_sender.sent} message(s) renvoyé(s), {len(mail_sender.failed)} toujours en attente."
+            show = ttk.Messagebox.show_info
+        except Exception as e:
+            message = f"Erreur lors de l'envoi du mail : {str(e)}"
+            show = ttk.Messagebox.show_error
+        self.root.after(0, lambda: show(title="Boîte d'envoi", message=message))
+
+    def _deliver_mail(self, form_data, pdf_path):
+        """Envoie le mail du bordereau ; retourne le message d'erreur à afficher, None en cas de succès."""
+        data = load_data()
+        if data is None:
+            return "Carnet d'adresses introuvable"
+
+        # Rechercher l'adresse du destinataire dans le carnet d'adresses
+        recipient = find_recipient_email(data, form_data['company'], form_data['receiver'])
+        if not recipient:
+            return f"Aucun email trouvé pour {form_data['receiver']} ({form_data['company']})"
+
+        try:
+            config = load_config()
+        except (OSError, ValueError) as e:
+            return f"Configuration SMTP invalide : {str(e)}"
+
+        try:
+            message = build_message(form_data, recipient, pdf_path, config['sender'])
+        except OSError as e:
+            return f"Lecture du PDF impossible : {str(e)}"
+
+        # Les messages restés dans la boîte d'envoi sont renvoyés au passage
+        mail_sender = send_messages([message], config)
+        if any(failed is message for failed in mail_sender.failed):
+            return "L'envoi du mail a échoué, le message a été placé dans la boîte d'envoi."
+        return None
 
 if __name__ == "__main__":
     app = ttk.Window()